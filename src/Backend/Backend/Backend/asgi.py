@@ -9,7 +9,8 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+# Streams responses off the event loop, see users_admins_app/asgi.py
+from users_admins_app.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Backend.settings')
 
@@ -15,9 +15,7 @@ from datetime import timedelta
 import os
 import environ
 import cloudinary
-from mongoengine import connect
 import certifi
-from mongoengine.connection import get_db
 
 
 
@@ -63,6 +61,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, to time the whole request, out of the stack unless enabled
+    'users_admins_app.instrumentation.TimingMiddleware',
+    # Warns about requests sending too many MongoDB commands, on in DEBUG
+    'users_admins_app.query_budget.QueryBudgetMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -97,9 +99,25 @@ WSGI_APPLICATION = 'Backend.wsgi.application'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
         'users_admins_app.jwt_middleware.JWTAuthentication',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        # JSONRenderer that reports its time to the instrumentation
+        'users_admins_app.instrumentation.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+}
+
+# Request timings in Server-Timing headers and per-route histograms at
+# /metrics/, see users_admins_app/instrumentation.py
+INSTRUMENTATION = {
+    'ENABLED': env.bool('INSTRUMENTATION_ENABLED', default=False),
+    'SERVER_TIMING': env.bool('INSTRUMENTATION_SERVER_TIMING', default=True),
+}
+
+QUERY_BUDGET = {
+    'ENABLED': env.bool('QUERY_BUDGET_ENABLED', default=DEBUG),
+    'MAX_COMMANDS': env.int('QUERY_BUDGET_MAX_COMMANDS', default=10),
 }
 
 SIMPLE_JWT = {
@@ -113,6 +131,29 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Cache of the authenticated account looked up by JWTAuthentication.
+# Set PRINCIPAL_CACHE_BACKEND=users_admins_app.principal_cache.DjangoPrincipalCache
+# to share it between workers through CACHES (e.g. a redis:// CACHE_URL).
+PRINCIPAL_CACHE = {
+    'BACKEND': env('PRINCIPAL_CACHE_BACKEND', default='users_admins_app.principal_cache.LocalPrincipalCache'),
+    'OPTIONS': {
+        'timeout': env.int('PRINCIPAL_CACHE_TIMEOUT', default=60),
+    },
+}
+
+# Seconds within which a new login does not rewrite Account.last_login
+LAST_LOGIN_GRANULARITY = env.int('LAST_LOGIN_GRANULARITY', default=60)
+
+# Serve login, the employee list, uploads and status updates with the
+# async views of users_admins_app/async_views.py. Only under ASGI
+# (uvicorn Backend.asgi:application), under WSGI they would each run
+# their own event loop.
+ASYNC_VIEWS = env.bool('ASYNC_VIEWS', default=False)
+
 CORS_ALLOW_ALL_ORIGINS = False
 
 CORS_ALLOWED_ORIGINS = [
@@ -169,18 +210,32 @@ CSRF_COOKIE_SECURE = True
 MONGODB_URI = env('MONGODB_URI')  
 DB_NAME = env('DB_NAME')  
 
-# Connect to MongoDB Atlas using MongoEngine
-try:
-    connect(
-        db=DB_NAME,
-        host=MONGODB_URI,
-        tls=True,
-        tlsCAFile=certifi.where(),
-        alias='default',
-    )
-    print("Successfully connected to MongoDB Atlas!")
-except Exception as e:
-    print(f"MongoDB Connection Error: {e}")
+# MongoDB Atlas through MongoEngine, see users_admins_app/mongo.py. The
+# connection is opened on the first query. OPTIONS go to pymongo's
+# MongoClient, unset ones keep the driver defaults.
+MONGODB = {
+    'NAME': DB_NAME,
+    'HOST': MONGODB_URI,
+    # Seconds a readiness probe waits for the server
+    'READY_TIMEOUT': env.float('MONGODB_READY_TIMEOUT', default=2.0),
+    'OPTIONS': {
+        key: value for key, value in {
+            # Off only for local servers, e.g. for benchmarks
+            'tls': env.bool('MONGODB_TLS', default=True),
+            'tlsCAFile': certifi.where() if env.bool('MONGODB_TLS', default=True) else None,
+            'maxPoolSize': env.int('MONGODB_MAX_POOL_SIZE', default=100),
+            'minPoolSize': env.int('MONGODB_MIN_POOL_SIZE', default=0),
+            'maxIdleTimeMS': env.int('MONGODB_MAX_IDLE_TIME_MS', default=None),
+            'waitQueueTimeoutMS': env.int('MONGODB_WAIT_QUEUE_TIMEOUT_MS', default=None),
+            'connectTimeoutMS': env.int('MONGODB_CONNECT_TIMEOUT_MS', default=10000),
+            'socketTimeoutMS': env.int('MONGODB_SOCKET_TIMEOUT_MS', default=None),
+            'serverSelectionTimeoutMS': env.int('MONGODB_SERVER_SELECTION_TIMEOUT_MS', default=30000),
+            'readPreference': env('MONGODB_READ_PREFERENCE', default='primary'),
+            # e.g. zstd,snappy,zlib, zstd and snappy need their packages
+            'compressors': env('MONGODB_COMPRESSORS', default=None),
+        }.items() if value is not None
+    },
+}
 
 
 
@@ -194,6 +249,56 @@ cloudinary.config(
     api_secret = env('API_SECRET'),
 )
 
+# Photo/resume uploads, see users_admins_app/uploads.py. With DEFERRED the
+# employee is saved immediately and the files are uploaded in the background.
+# Use users_admins_app.uploads.LocalStubUploader to work offline.
+EMPLOYEE_UPLOADS = {
+    'BACKEND': env('UPLOAD_BACKEND', default='users_admins_app.uploads.CloudinaryUploader'),
+    'DEFERRED': env.bool('UPLOAD_DEFERRED', default=False),
+    'MAX_WORKERS': env.int('UPLOAD_MAX_WORKERS', default=8),
+    'MAX_FILE_SIZES': {
+        'photo': env.int('UPLOAD_MAX_PHOTO_SIZE', default=5 * 1024 * 1024),
+        'resume': env.int('UPLOAD_MAX_RESUME_SIZE', default=10 * 1024 * 1024),
+        'manifest': env.int('UPLOAD_MAX_MANIFEST_SIZE', default=10 * 1024 * 1024),
+        'archive': env.int('UPLOAD_MAX_ARCHIVE_SIZE', default=1024 * 1024 * 1024),
+    },
+    'IMPORT_CONCURRENCY': env.int('IMPORT_CONCURRENCY', default=4),
+    'IMPORT_BATCH_SIZE': env.int('IMPORT_BATCH_SIZE', default=100),
+}
+
+# Files are checked against EMPLOYEE_UPLOADS['MAX_FILE_SIZES'] while the
+# request is parsed, and spooled to disk once a request body is bigger
+# than FILE_UPLOAD_MAX_MEMORY_SIZE.
+FILE_UPLOAD_HANDLERS = [
+    'users_admins_app.uploads.SizeLimitUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+FILE_UPLOAD_MAX_MEMORY_SIZE = env.int('FILE_UPLOAD_MAX_MEMORY_SIZE', default=256 * 1024)
+
+
+
+# Password hashing, the first hasher is used for new hashes and the others
+# only verify existing ones. A login with a hash made by another hasher, or
+# with other PASSWORD_HASHING parameters, rehashes the password.
+# Argon2 needs the argon2-cffi package and BCrypt the bcrypt package.
+PASSWORD_HASHERS = env.list('PASSWORD_HASHERS', default=[
+    'users_admins_app.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'users_admins_app.hashers.Argon2PasswordHasher',
+    'users_admins_app.hashers.BCryptSHA256PasswordHasher',
+    'users_admins_app.hashers.ScryptPasswordHasher',
+])
+
+PASSWORD_HASHING = {
+    'PBKDF2_ITERATIONS': env.int('PBKDF2_ITERATIONS', default=390000),
+    'SCRYPT_WORK_FACTOR': env.int('SCRYPT_WORK_FACTOR', default=2 ** 14),
+    'ARGON2_TIME_COST': env.int('ARGON2_TIME_COST', default=2),
+    'ARGON2_MEMORY_COST': env.int('ARGON2_MEMORY_COST', default=102400),
+    'ARGON2_PARALLELISM': env.int('ARGON2_PARALLELISM', default=8),
+    'BCRYPT_ROUNDS': env.int('BCRYPT_ROUNDS', default=12),
+    'WORKERS': env.int('PASSWORD_HASHING_WORKERS', default=os.cpu_count()),
+}
 
 
 # Password validation
@@ -260,6 +365,10 @@ LOGGING = {
         },
     },
     'loggers': {
+        'users_admins_app': {
+            'handlers': ['console'],
+            'level': env('LOG_LEVEL', default='INFO'),
+        },
         'jwt_middleware': {
             'handlers': ['file', 'console'],
             'level': 'DEBUG',
@@ -17,7 +17,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from . import settings
+from users_admins_app.views import MetricsView, ReadinessView
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('user/', include('users_admins_app.urls')),
+    path('ready/', ReadinessView.as_view(), name='ready'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
@@ -0,0 +1,274 @@
+"""Throughput and latency percentiles of the API routes, written as JSON.
+
+    python -m benchmarks.api_load [--checkers N] [--makers N] [--employees N]
+        [--concurrency N] [--requests N] [--scenarios login,list,...]
+        [--mongodb-uri URI] [--output FILE] [--compare BASELINE.json]
+
+Seeds `checkers` checkers with `makers` makers each and `employees`
+employees per maker, then sends each scenario's requests through the
+Django test client from `concurrency` threads, so they go through the
+real routes, middleware and views. The database is in-memory mongomock
+unless --mongodb-uri points at a local server, where the scratch
+checkmate_benchmark database is dropped and seeded. Uploads go to the
+LocalStubUploader in a temporary directory instead of Cloudinary, and
+passwords use cheap PBKDF2 so logins measure the view rather than the
+hasher, see login_throughput for that. Each thread reviews its own share
+of the employees, concurrent reviews of one employee would only measure
+409s, and mongomock is not safe for concurrent writes to one document.
+
+The report holds the configuration, the commit and, per scenario, the
+request and error counts, requests per second and p50/p90/p99 latencies.
+Reports are comparable when taken with the same arguments on the same
+machine: --compare prints the change against an earlier report and exits
+with an error when a p50 latency or a throughput got worse by more than
+--max-regression percent.
+"""
+import argparse
+import itertools
+import json
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from benchmarks.common import percentile, setup
+
+PASSWORD = 'benchmark-secret'
+SCENARIOS = ('login', 'refresh-token', 'list', 'upload', 'status', 'fetch-makers')
+
+
+def seed(args):
+    """Checkers, their makers and the makers' employees, with tokens for each."""
+    from users_admins_app.models import Account, CustomerStatus, Employee, EmployeeCounter
+    from users_admins_app.views import get_tokens_for_user
+
+    for document in (Account, Employee, EmployeeCounter):
+        document.drop_collection()
+
+    statuses = list(CustomerStatus)
+    seeded = {'checkers': [], 'makers': [], 'employees': []}
+    for checker_number in range(args.checkers):
+        checker = Account.create_checker(email=f'checker{checker_number}@example.com', password=PASSWORD)
+        tokens = get_tokens_for_user(checker)
+        for maker_number in range(args.makers):
+            maker = Account.create_maker(
+                email=f'maker{checker_number}-{maker_number}@example.com', password=PASSWORD, created_by=checker
+            )
+            employees = [
+                Employee(
+                    first_name=f'First{number}',
+                    last_name=f'Last{number}',
+                    photo_url='https://example.com/photo.jpg',
+                    resume_url='https://example.com/resume.pdf',
+                    uploaded_by=maker,
+                    uploaded_by_email=maker.email,
+                    checker_id=checker.id,
+                    status=statuses[number % len(statuses)],
+                )
+                for number in range(args.employees)
+            ]
+            if employees:
+                Employee.objects.insert(employees, load_bulk=False)
+            counts = {status.value: sum(e.status == status for e in employees) for status in statuses}
+            EmployeeCounter.add(maker.id, checker.id, **counts)
+            seeded['employees'].extend((employee.id, tokens) for employee in employees)
+            seeded['makers'].append({'email': maker.email, **get_tokens_for_user(maker)})
+        seeded['checkers'].append({'email': checker.email, **tokens})
+    return seeded
+
+
+def request_for(name, seeded, concurrency):
+    """A function sending one `name` request from a worker thread, with its
+    test client, random generator and number."""
+    from django.core.files.uploadedfile import SimpleUploadedFile
+
+    shares = [seeded['employees'][worker::concurrency] for worker in range(concurrency)]
+
+    def bearer(account):
+        return {'HTTP_AUTHORIZATION': f"Bearer {account['access']}"}
+
+    def login(client, rng, worker):
+        maker = rng.choice(seeded['makers'])
+        return client.post('/user/login/', {'email': maker['email'], 'password': PASSWORD})
+
+    def refresh_token(client, rng, worker):
+        client.cookies['refresh_token'] = rng.choice(seeded['makers'])['refresh']
+        return client.post('/user/refresh-token/')
+
+    def employee_list(client, rng, worker):
+        return client.get('/user/employees/', {'limit': 50}, **bearer(rng.choice(seeded['checkers'])))
+
+    def upload(client, rng, worker):
+        return client.post('/user/employees/upload/', {
+            'first_name': 'Jane',
+            'last_name': 'Doe',
+            'photo': SimpleUploadedFile('photo.jpg', b'p' * 20000, content_type='image/jpeg'),
+            'resume': SimpleUploadedFile('resume.pdf', b'r' * 50000, content_type='application/pdf'),
+        }, **bearer(rng.choice(seeded['makers'])))
+
+    def status_update(client, rng, worker):
+        employee_id, checker = rng.choice(shares[worker])
+        return client.patch(
+            f"/user/employees/{employee_id}/status/",
+            {'status': rng.choice(['approved', 'declined', 'pending'])},
+            content_type='application/json',
+            **bearer(checker)
+        )
+
+    def fetch_makers(client, rng, worker):
+        return client.get('/user/fetch-makers/', **bearer(rng.choice(seeded['checkers'])))
+
+    return {
+        'login': login,
+        'refresh-token': refresh_token,
+        'list': employee_list,
+        'upload': upload,
+        'status': status_update,
+        'fetch-makers': fetch_makers,
+    }[name]
+
+
+def run_scenario(send, name, args):
+    """Send args.requests requests from args.concurrency threads, each with
+    its own client and random generator."""
+    from django.test import Client
+
+    latencies = []
+    errors = []
+    local = threading.local()
+    workers = itertools.count()
+
+    def one(_):
+        if not hasattr(local, 'client'):
+            local.client = Client()
+            local.worker = next(workers)
+            local.rng = random.Random(f'{args.seed}-{name}-{local.worker}')
+        start = time.perf_counter()
+        response = send(local.client, local.rng, local.worker)
+        elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            errors.append(response.status_code)
+        latencies.append(elapsed)
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as clients:
+        # Warm up imports, caches and pools outside of the measurement
+        list(clients.map(one, range(args.concurrency)))
+        latencies.clear()
+        errors.clear()
+        start = time.perf_counter()
+        list(clients.map(one, range(args.requests)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'error_statuses': sorted(set(errors)),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p90_ms': round(percentile(latencies, 0.9) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, max_regression):
+    """Print each scenario's change against baseline, return the regressions."""
+    regressions = []
+    print(f'{"scenario":<14}{"req/s":>10}{"change":>9}{"p50 ms":>10}{"change":>9}', file=sys.stderr)
+    for name, result in report['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if not before:
+            continue
+        throughput = (result['requests_per_second'] / before['requests_per_second'] - 1) * 100
+        latency = (result['p50_ms'] / before['p50_ms'] - 1) * 100
+        print(f'{name:<14}{result["requests_per_second"]:>10.1f}{throughput:>+8.1f}%'
+              f'{result["p50_ms"]:>10.2f}{latency:>+8.1f}%', file=sys.stderr)
+        if throughput < -max_regression or latency > max_regression:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--checkers', type=int, default=2)
+    parser.add_argument('--makers', type=int, default=5, help='per checker')
+    parser.add_argument('--employees', type=int, default=100, help='per maker')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=500, help='per scenario')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--mongodb-uri', help='a local server, the default is in-memory mongomock')
+    parser.add_argument('--pbkdf2-iterations', type=int, default=1000)
+    parser.add_argument('--output', help='report file, the default is stdout')
+    parser.add_argument('--compare', help='an earlier report to compare with')
+    parser.add_argument('--max-regression', type=float, default=10, help='percent')
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(',')
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'unknown scenarios: {", ".join(sorted(unknown))}')
+
+    setup(args.mongodb_uri)
+
+    from django.test import override_settings
+
+    upload_dir = tempfile.TemporaryDirectory()
+    overrides = override_settings(
+        PASSWORD_HASHERS=['users_admins_app.hashers.PBKDF2PasswordHasher'],
+        PASSWORD_HASHING={'PBKDF2_ITERATIONS': args.pbkdf2_iterations},
+        EMPLOYEE_UPLOADS={
+            'BACKEND': 'users_admins_app.uploads.LocalStubUploader',
+            'OPTIONS': {'location': upload_dir.name, 'base_url': 'https://files.benchmark'},
+        },
+    )
+    with upload_dir, overrides:
+        seeded = seed(args)
+        results = {}
+        for name in scenarios:
+            results[name] = run_scenario(request_for(name, seeded, args.concurrency), name, args)
+            print(f'{name:<14}{results[name]["requests_per_second"]:>10.1f} req/s'
+                  f'{results[name]["p50_ms"]:>10.2f} ms p50', file=sys.stderr)
+
+    report = {
+        'commit': git_commit(),
+        'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'database': 'mongodb' if args.mongodb_uri else 'mongomock',
+        'config': {
+            key: getattr(args, key)
+            for key in ('checkers', 'makers', 'employees', 'concurrency', 'requests', 'seed', 'pbkdf2_iterations')
+        },
+        'scenarios': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = compare(report, json.load(baseline), args.max_regression)
+        if regressions:
+            raise SystemExit(f'Regressed past {args.max_regression:.0f}%: {", ".join(regressions)}')
+
+
+if __name__ == '__main__':
+    main()
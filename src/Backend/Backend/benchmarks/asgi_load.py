@@ -0,0 +1,196 @@
+"""Latency and throughput of the busiest endpoints under WSGI and under ASGI.
+
+    python -m benchmarks.asgi_load --mongodb-uri mongodb://localhost:27017
+        [--workers N] [--threads N] [--concurrency N] [--duration S]
+
+Unlike the other benchmarks this one needs a real MongoDB server, since the
+servers under test run in their own processes: it writes to a scratch
+checkmate_loadtest database. gunicorn serves the APIViews with
+workers x threads, uvicorn serves the async views (ASYNC_VIEWS) with the
+same number of workers. Both get the same mix of logins, employee list
+reads, status updates and uploads (to the local stub uploader) from
+`concurrency` concurrent httpx clients. Needs gunicorn and uvicorn.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.common import BENCHMARK_ENV
+
+# (name, weight) of the request mix
+SCENARIOS = [('list', 60), ('status', 25), ('login', 10), ('upload', 5)]
+PASSWORD = 'load-test-secret'
+
+
+def server_env(args, **extra):
+    return {
+        **os.environ,
+        **BENCHMARK_ENV,
+        'DEBUG': '',
+        'MONGODB_URI': args.mongodb_uri,
+        'MONGODB_TLS': 'false',
+        'DB_NAME': 'checkmate_loadtest',
+        'PASSWORD_HASHERS': 'users_admins_app.hashers.PBKDF2PasswordHasher',
+        'PBKDF2_ITERATIONS': str(args.pbkdf2_iterations),
+        'UPLOAD_BACKEND': 'users_admins_app.uploads.LocalStubUploader',
+        **extra,
+    }
+
+
+def seed(args, env):
+    """Create a checker, makers and their employees in the scratch database."""
+    os.environ.update(env)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Backend.settings')
+    import django
+    django.setup()
+
+    from users_admins_app.models import Account, Employee, EmployeeCounter
+    from users_admins_app.views import get_tokens_for_user
+
+    for document in (Account, Employee, EmployeeCounter):
+        document.drop_collection()
+    checker = Account.create_checker(email='load-checker@example.com', password=PASSWORD)
+    maker = Account.create_maker(email='load-maker@example.com', password=PASSWORD, created_by=checker)
+    employees = [
+        Employee(
+            first_name=f'First{number}',
+            last_name=f'Last{number}',
+            photo_url='https://example.com/photo.jpg',
+            resume_url='https://example.com/resume.pdf',
+            uploaded_by=maker,
+            uploaded_by_email=maker.email,
+            checker_id=checker.id,
+        )
+        for number in range(args.employees)
+    ]
+    Employee.objects.insert(employees, load_bulk=False)
+    EmployeeCounter.add(maker.id, checker.id, pending=args.employees)
+    return {
+        'checker': get_tokens_for_user(checker)['access'],
+        'maker': get_tokens_for_user(maker)['access'],
+        'employee_ids': [employee.id for employee in employees],
+    }
+
+
+def start_server(name, command, env, port):
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f'http://127.0.0.1:{port}/ready/').status_code == 200:
+                return process
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise SystemExit(f'{name} did not become ready on port {port}')
+
+
+async def run_load(base_url, seeded, args):
+    latencies = {name: [] for name, _ in SCENARIOS}
+    errors = dict.fromkeys(latencies, 0)
+    picks = random.Random(0).choices(
+        [name for name, _ in SCENARIOS], weights=[weight for _, weight in SCENARIOS], k=10000
+    )
+    picks = itertools.cycle(picks)
+    checker = {'Authorization': f"Bearer {seeded['checker']}"}
+    maker = {'Authorization': f"Bearer {seeded['maker']}"}
+
+    async def request(client, name):
+        if name == 'list':
+            return await client.get('/user/employees/?limit=50', headers=checker)
+        if name == 'status':
+            employee_id = random.choice(seeded['employee_ids'])
+            status = random.choice(['approved', 'declined', 'pending'])
+            return await client.patch(f'/user/employees/{employee_id}/status/', json={'status': status}, headers=checker)
+        if name == 'login':
+            return await client.post('/user/login/', json={'email': 'load-maker@example.com', 'password': PASSWORD})
+        return await client.post(
+            '/user/employees/upload/',
+            data={'first_name': 'Jane', 'last_name': 'Doe'},
+            files={'photo': ('photo.jpg', b'p' * 20000), 'resume': ('resume.pdf', b'r' * 50000)},
+            headers=maker
+        )
+
+    async def worker(client, deadline):
+        while time.perf_counter() < deadline:
+            name = next(picks)
+            start = time.perf_counter()
+            response = await request(client, name)
+            latencies[name].append(time.perf_counter() - start)
+            # A concurrent review of the same employee is a valid answer
+            if response.status_code >= 400 and response.status_code != 409:
+                errors[name] += 1
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        # Warm up every worker process before measuring
+        await asyncio.gather(*(request(client, name) for name, _ in SCENARIOS * args.workers))
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*(worker(client, deadline) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def report(server, latencies, errors, elapsed):
+    total = []
+    for name, timings in latencies.items():
+        total.extend(timings)
+        print_row(server, name, sorted(timings), errors[name], elapsed)
+    print_row(server, 'all', sorted(total), sum(errors.values()), elapsed)
+
+
+def print_row(server, name, timings, errors, elapsed):
+    if not timings:
+        return
+    p50 = timings[len(timings) // 2] * 1000
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000
+    print(f'{server:<10}{name:<8}{len(timings):>9}{len(timings) / elapsed:>9.0f}{p50:>9.1f}{p99:>9.1f}{errors:>8}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mongodb-uri', required=True)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8, help='per gunicorn worker')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--employees', type=int, default=1000)
+    parser.add_argument('--pbkdf2-iterations', type=int, default=20000)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    seeded = seed(args, server_env(args))
+    servers = [
+        ('wsgi', [
+            sys.executable, '-m', 'gunicorn', 'Backend.wsgi:application',
+            '--workers', str(args.workers), '--threads', str(args.threads),
+            '--bind', f'127.0.0.1:{args.port}',
+        ], server_env(args)),
+        ('asgi', [
+            sys.executable, '-m', 'uvicorn', 'Backend.asgi:application',
+            '--workers', str(args.workers), '--port', str(args.port), '--no-access-log',
+        ], server_env(args, ASYNC_VIEWS='true')),
+    ]
+
+    print(f'{args.concurrency} clients for {args.duration:.0f}s, {args.workers} workers, '
+          f'{args.threads} threads per WSGI worker')
+    print(f'{"server":<10}{"request":<8}{"count":>9}{"req/s":>9}{"p50 ms":>9}{"p99 ms":>9}{"errors":>8}')
+    for name, command, env in servers:
+        process = start_server(name, command, env, args.port)
+        try:
+            report(name, *asyncio.run(run_load(f'http://127.0.0.1:{args.port}', seeded, args)))
+        finally:
+            process.terminate()
+            process.wait()
+
+if __name__ == '__main__':
+    main()
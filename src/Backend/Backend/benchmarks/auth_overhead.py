@@ -0,0 +1,88 @@
+"""Per-request authentication overhead, before and after consolidating
+the two stacked JWT authenticators.
+
+    python -m benchmarks.auth_overhead [--iterations N]
+"""
+import argparse
+
+from benchmarks.common import setup, measure, summarize
+
+# The exempt list the custom authenticator used to scan on every request
+LEGACY_EXEMPT_PATHS = [
+    '/user/register/',
+    '/user/login/',
+    '/user/logout/',
+    '/user/admin-login/',
+    '/user/refresh-token/',
+    '/user/google-auth/',
+    '/user/verify-otp/',
+    '/user/resend-otp/',
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=5000)
+    args = parser.parse_args()
+
+    setup()
+
+    import jwt
+    from django.conf import settings
+    from django.test import RequestFactory
+    from rest_framework.request import Request
+    from rest_framework_simplejwt.authentication import JWTAuthentication as SimpleJWTAuthentication
+    from users_admins_app.jwt_middleware import JWTAuthentication
+    from users_admins_app.models import Account
+    from users_admins_app.principal_cache import get_principal_cache
+    from users_admins_app.views import get_tokens_for_user
+
+    Account.drop_collection()
+    user = Account.create_checker(email='bench@example.com', password='secret')
+    token = get_tokens_for_user(user)['access']
+
+    factory = RequestFactory()
+    cookie_request = factory.get('/user/employees/')
+    cookie_request.COOKIES['access_token'] = token
+    cookie_request = Request(cookie_request)
+    header_request = Request(
+        factory.get('/user/employees/', HTTP_AUTHORIZATION=f'Bearer {token}')
+    )
+
+    def legacy():
+        # simplejwt finds no header and passes, then the custom class
+        # scans the exempt paths, decodes and loads the account
+        SimpleJWTAuthentication().authenticate(cookie_request)
+        if any(cookie_request.path.endswith(path) for path in LEGACY_EXEMPT_PATHS):
+            return
+        payload = jwt.decode(
+            cookie_request.COOKIES['access_token'], settings.SECRET_KEY, algorithms=['HS256']
+        )
+        Account.objects.get(id=payload['user_id'])
+
+    principal_cache = get_principal_cache()
+
+    def consolidated_cold():
+        principal_cache.invalidate(user.id)
+        JWTAuthentication().authenticate(cookie_request)
+
+    def consolidated_cookie():
+        JWTAuthentication().authenticate(cookie_request)
+
+    def consolidated_header():
+        JWTAuthentication().authenticate(header_request)
+
+    cases = [
+        ('legacy stacked authenticators', legacy),
+        ('consolidated, principal cache miss', consolidated_cold),
+        ('consolidated, cookie', consolidated_cookie),
+        ('consolidated, bearer header', consolidated_header),
+    ]
+    print(f'{"case":<40}{"mean us":>10}{"p50 us":>10}{"p99 us":>10}')
+    for name, func in cases:
+        result = summarize(measure(func, args.iterations))
+        print(f'{name:<40}{result["mean_us"]:>10.1f}{result["p50_us"]:>10.1f}{result["p99_us"]:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
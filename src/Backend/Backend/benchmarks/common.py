@@ -0,0 +1,63 @@
+"""Shared setup for the benchmarks in this package.
+
+Run them from the directory holding manage.py, e.g.
+`python -m benchmarks.auth_overhead`. They use an in-memory mongomock
+database so they never touch the Atlas cluster configured in .env, or
+a local server when given its URI.
+"""
+import os
+import statistics
+import time
+
+BENCHMARK_ENV = {
+    'SECRET_KEY': 'benchmark-secret-key-not-for-production-use',
+    'MONGODB_URI': 'mongodb://localhost:27017',
+    'DB_NAME': 'checkmate_benchmark',
+    'CLOUD_NAME': 'benchmark',
+    'API_KEY': 'benchmark',
+    'API_SECRET': 'benchmark',
+}
+
+
+def setup(mongodb_uri=None):
+    for key, value in BENCHMARK_ENV.items():
+        os.environ.setdefault(key, value)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Backend.settings')
+    if mongodb_uri:
+        # Over .env, the app then connects to the scratch database itself
+        os.environ.update(MONGODB_URI=mongodb_uri, MONGODB_TLS='false', DB_NAME=BENCHMARK_ENV['DB_NAME'])
+
+    import django
+    django.setup()
+    if mongodb_uri:
+        return
+
+    import mongomock
+    from mongoengine import connect, disconnect
+    disconnect()
+    connect(BENCHMARK_ENV['DB_NAME'], mongo_client_class=mongomock.MongoClient)
+
+
+def measure(func, iterations):
+    """Call func `iterations` times, return per-call timings in seconds."""
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def percentile(timings, fraction):
+    """Nearest-rank percentile of sorted timings, e.g. fraction=0.99."""
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    return {
+        'calls': len(timings),
+        'mean_us': statistics.fmean(timings) * 1e6,
+        'p50_us': percentile(timings, 0.5) * 1e6,
+        'p99_us': percentile(timings, 0.99) * 1e6,
+    }
@@ -0,0 +1,76 @@
+"""Rows per second of rendering the employee list, through the DRF
+serializer and through the raw-document row mapper.
+
+    python -m benchmarks.employee_serialization [--employees N] [--iterations N]
+
+Each mode loads the employees, maps them to rows and renders the JSON,
+the way EmployeeListView does. Both outputs are checked to be identical.
+"""
+import argparse
+import statistics
+import uuid
+
+from benchmarks.common import setup, measure
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--employees', type=int, default=10000)
+    parser.add_argument('--iterations', type=int, default=5)
+    args = parser.parse_args()
+
+    setup()
+
+    from rest_framework.renderers import JSONRenderer
+    from users_admins_app.fast_serializers import build_raw_account_email_map, employee_row_mapper, render_json
+    from users_admins_app.models import Account, CustomerStatus, Employee
+    from users_admins_app.serializers import FetchEmployeeSerializer, build_account_email_map
+
+    Account.drop_collection()
+    Employee.drop_collection()
+    checker = Account.create_checker(email='bench-checker@example.com', password='secret')
+    maker = Account.create_maker(email='bench-maker@example.com', password='secret', created_by=checker)
+    statuses = list(CustomerStatus)
+    Employee.objects.insert([
+        Employee(
+            first_name=f'First{number}',
+            last_name=f'Last{number}',
+            photo_url=f'https://example.com/photos/{uuid.uuid4().hex}.jpg',
+            photo_public_id=f'employees/photos/{number}',
+            resume_url=f'https://example.com/resumes/{uuid.uuid4().hex}.pdf',
+            resume_public_id=f'employees/resumes/{number}',
+            uploaded_by=maker,
+            uploaded_by_email=maker.email,
+            checker_id=checker.id,
+            checked_by=checker if number % 2 else None,
+            checked_by_email=checker.email if number % 2 else None,
+            status=statuses[number % len(statuses)]
+        )
+        for number in range(args.employees)
+    ], load_bulk=False)
+    employees = Employee.objects(checker_id=checker.id).order_by('-created_at', '-id')
+
+    def drf():
+        documents = list(employees.no_dereference())
+        return JSONRenderer().render(FetchEmployeeSerializer(
+            documents, many=True, context={'account_emails': build_account_email_map(documents)}
+        ).data)
+
+    def fast():
+        documents = list(employees.as_pymongo())
+        to_row = employee_row_mapper(account_emails=build_raw_account_email_map(documents))
+        return render_json([to_row(document) for document in documents])
+
+    if drf() != fast():
+        raise SystemExit('The two modes render different JSON')
+
+    print(f'{args.employees} employees, best of {args.iterations}')
+    print(f'{"mode":<12}{"best ms":>10}{"mean ms":>10}{"rows/s":>12}')
+    for name, render in (('drf', drf), ('fast', fast)):
+        timings = measure(render, args.iterations)
+        best = min(timings)
+        print(f'{name:<12}{best * 1000:>10.1f}{statistics.fmean(timings) * 1000:>10.1f}{args.employees / best:>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Login throughput for each password hasher configuration.
+
+    python -m benchmarks.login_throughput [--logins N] [--concurrency N]
+
+Logins go through the login view with the Django test client from
+`concurrency` threads, so the numbers include the hashing pool. Argon2 and
+BCrypt configurations are skipped when their package is not installed.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import setup
+
+CONFIGS = [
+    ('pbkdf2 390000 (default)', 'users_admins_app.hashers.PBKDF2PasswordHasher', {'PBKDF2_ITERATIONS': 390000}),
+    ('pbkdf2 100000', 'users_admins_app.hashers.PBKDF2PasswordHasher', {'PBKDF2_ITERATIONS': 100000}),
+    ('scrypt n=2^14', 'users_admins_app.hashers.ScryptPasswordHasher', {'SCRYPT_WORK_FACTOR': 2 ** 14}),
+    ('argon2 t=2 m=100MB', 'users_admins_app.hashers.Argon2PasswordHasher', {}),
+    ('argon2 t=1 m=19MB', 'users_admins_app.hashers.Argon2PasswordHasher',
+     {'ARGON2_TIME_COST': 1, 'ARGON2_MEMORY_COST': 19456, 'ARGON2_PARALLELISM': 1}),
+    ('bcrypt 12 rounds', 'users_admins_app.hashers.BCryptSHA256PasswordHasher', {'BCRYPT_ROUNDS': 12}),
+    ('bcrypt 10 rounds', 'users_admins_app.hashers.BCryptSHA256PasswordHasher', {'BCRYPT_ROUNDS': 10}),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=64)
+    parser.add_argument('--concurrency', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    setup()
+
+    from django.contrib.auth.hashers import get_hasher
+    from django.test import Client, override_settings
+    from users_admins_app.models import Account
+
+    cores = os.cpu_count()
+    print(f'{args.logins} logins from {args.concurrency} threads on {cores} cores')
+    print(f'{"hasher":<26}{"logins/s":>10}{"logins/s/core":>15}{"ms/login":>10}')
+
+    for name, hasher, params in CONFIGS:
+        with override_settings(PASSWORD_HASHERS=[hasher], PASSWORD_HASHING=params):
+            try:
+                if get_hasher().library:
+                    get_hasher()._load_library()
+            except ValueError:
+                print(f'{name:<26}{"skipped, library not installed":>35}')
+                continue
+
+            Account.drop_collection()
+            Account.create_checker(email='bench-checker@example.com', password='secret')
+            credentials = {'email': 'bench-checker@example.com', 'password': 'secret'}
+
+            def login(_):
+                response = Client().post('/user/login/', credentials)
+                if response.status_code != 200:
+                    raise SystemExit(f'{name}: unexpected response {response.status_code}')
+
+            # Warm up imports and the hashing pool outside of the measurement
+            login(None)
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as clients:
+                list(clients.map(login, range(args.logins)))
+            elapsed = time.perf_counter() - start
+
+        rate = args.logins / elapsed
+        print(f'{name:<26}{rate:>10.1f}{rate / cores:>15.2f}{elapsed / args.logins * 1000:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
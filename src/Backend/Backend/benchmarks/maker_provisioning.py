@@ -0,0 +1,64 @@
+"""Time to onboard makers one request at a time and with the bulk endpoint.
+
+    python -m benchmarks.maker_provisioning [--makers N] [--pbkdf2-iterations N]
+
+Both go through the views with the Django test client. Hashing dominates
+both modes, the iteration count defaults well below the production one
+so that the serial run finishes in reasonable time.
+"""
+import argparse
+import time
+
+from benchmarks.common import setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--makers', type=int, default=1000)
+    parser.add_argument('--pbkdf2-iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    setup()
+
+    from django.test import Client, override_settings
+    from users_admins_app.models import Account
+    from users_admins_app.views import get_tokens_for_user
+
+    def run(name, provision):
+        Account.drop_collection()
+        checker = Account.create_checker(email='bench-checker@example.com', password='secret')
+        client = Client()
+        client.cookies['access_token'] = get_tokens_for_user(checker)['access']
+        makers = [
+            {'email': f'maker{number}@example.com', 'password': f'secret-{number}'}
+            for number in range(args.makers)
+        ]
+
+        start = time.perf_counter()
+        provision(client, makers)
+        elapsed = time.perf_counter() - start
+
+        created = Account.objects(created_by=checker.id).count()
+        if created != args.makers:
+            raise SystemExit(f'{name}: created {created} of {args.makers} makers')
+        print(f'{name:<16}{elapsed:>10.2f}{args.makers / elapsed:>12.1f}')
+
+    def one_by_one(client, makers):
+        for maker in makers:
+            client.post('/user/register/maker/', maker)
+
+    def bulk(client, makers):
+        client.post('/user/register/makers/', {'makers': makers}, content_type='application/json')
+
+    print(f'{args.makers} makers, pbkdf2 with {args.pbkdf2_iterations} iterations')
+    print(f'{"mode":<16}{"seconds":>10}{"makers/s":>12}')
+    with override_settings(
+        PASSWORD_HASHERS=['users_admins_app.hashers.PBKDF2PasswordHasher'],
+        PASSWORD_HASHING={'PBKDF2_ITERATIONS': args.pbkdf2_iterations}
+    ):
+        run('one by one', one_by_one)
+        run('bulk', bulk)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Peak memory of concurrent employee uploads, with Django's default upload
+handling and with the size-limited, disk-spooled handling from settings.
+
+    python -m benchmarks.upload_memory [--concurrency N] [--photo-mb M] [--resume-mb M]
+
+Requests go over HTTP to a threaded WSGI server in this process, the
+client streams each body from a file so that only server-side allocations
+show up in the tracemalloc peak. Files are stored with LocalStubUploader.
+"""
+import argparse
+import http.client
+import os
+import tempfile
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from benchmarks.common import setup
+
+BOUNDARY = 'checkmate-benchmark-boundary'
+MB = 1024 * 1024
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def write_multipart_body(path, photo_size, resume_size):
+    block = os.urandom(64 * 1024)
+
+    def write_file(body, field, filename, content_type, size):
+        body.write(
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{field}"; '
+            f'filename="{filename}"\r\nContent-Type: {content_type}\r\n\r\n'.encode()
+        )
+        for offset in range(0, size, len(block)):
+            body.write(block[:min(len(block), size - offset)])
+        body.write(b'\r\n')
+
+    with open(path, 'wb') as body:
+        for field, value in (('first_name', 'Jane'), ('last_name', 'Doe')):
+            body.write(
+                f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{field}"\r\n\r\n{value}\r\n'.encode()
+            )
+        write_file(body, 'photo', 'photo.jpg', 'image/jpeg', photo_size)
+        write_file(body, 'resume', 'resume.pdf', 'application/pdf', resume_size)
+        body.write(f'--{BOUNDARY}--\r\n'.encode())
+
+
+def post_upload(port, body_path, token):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    with open(body_path, 'rb') as body:
+        connection.request('POST', '/user/employees/upload/', body=body, headers={
+            'Content-Type': f'multipart/form-data; boundary={BOUNDARY}',
+            'Content-Length': str(os.path.getsize(body_path)),
+            'Cookie': f'access_token={token}',
+        })
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    return response.status
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--photo-mb', type=float, default=0.5)
+    parser.add_argument('--resume-mb', type=float, default=1.5)
+    args = parser.parse_args()
+
+    setup()
+
+    from django.conf import global_settings, settings
+    from django.core.wsgi import get_wsgi_application
+    from django.test import override_settings
+    from users_admins_app.models import Account, Employee
+    from users_admins_app.views import get_tokens_for_user
+
+    Account.drop_collection()
+    Employee.drop_collection()
+    checker = Account.create_checker(email='bench-checker@example.com', password='secret')
+    maker = Account.create_maker(email='bench-maker@example.com', password='secret', created_by=checker)
+    token = get_tokens_for_user(maker)['access']
+
+    workdir = tempfile.TemporaryDirectory()
+    body_path = os.path.join(workdir.name, 'body.multipart')
+    write_multipart_body(body_path, int(args.photo_mb * MB), int(args.resume_mb * MB))
+
+    server = make_server(
+        '127.0.0.1', 0, get_wsgi_application(),
+        server_class=ThreadingWSGIServer, handler_class=QuietHandler
+    )
+    port = server.server_address[1]
+    executor = ThreadPoolExecutor(max_workers=1)
+    executor.submit(server.serve_forever)
+
+    stub_uploads = {
+        'BACKEND': 'users_admins_app.uploads.LocalStubUploader',
+        'OPTIONS': {'location': os.path.join(workdir.name, 'uploads')},
+    }
+    modes = [
+        ('django defaults', {
+            'FILE_UPLOAD_HANDLERS': global_settings.FILE_UPLOAD_HANDLERS,
+            'FILE_UPLOAD_MAX_MEMORY_SIZE': global_settings.FILE_UPLOAD_MAX_MEMORY_SIZE,
+            'EMPLOYEE_UPLOADS': {**stub_uploads, 'MAX_FILE_SIZES': {}},
+        }),
+        ('streaming (settings)', {
+            'FILE_UPLOAD_HANDLERS': settings.FILE_UPLOAD_HANDLERS,
+            'FILE_UPLOAD_MAX_MEMORY_SIZE': settings.FILE_UPLOAD_MAX_MEMORY_SIZE,
+            'EMPLOYEE_UPLOADS': {**settings.EMPLOYEE_UPLOADS, **stub_uploads},
+        }),
+    ]
+
+    print(f'{args.concurrency} concurrent uploads of a {args.photo_mb}MB photo and a {args.resume_mb}MB resume')
+    print(f'{"mode":<24}{"peak MB":>10}{"peak MB / upload":>18}')
+    try:
+        for name, overrides in modes:
+            with override_settings(**overrides):
+                # Warm up imports and caches outside of the measurement
+                post_upload(port, body_path, token)
+                tracemalloc.start()
+                with ThreadPoolExecutor(max_workers=args.concurrency) as clients:
+                    statuses = list(clients.map(
+                        lambda _: post_upload(port, body_path, token), range(args.concurrency)
+                    ))
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+            if any(status != 201 for status in statuses):
+                raise SystemExit(f'{name}: unexpected responses {statuses}')
+            print(f'{name:<24}{peak / MB:>10.1f}{peak / MB / args.concurrency:>18.2f}')
+    finally:
+        server.shutdown()
+        executor.shutdown()
+        workdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class UsersAdminsAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users_admins_app'
+
+    def ready(self):
+        from .mongo import register_mongodb
+        register_mongodb()
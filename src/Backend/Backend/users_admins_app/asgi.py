@@ -0,0 +1,62 @@
+"""The ASGI handler of Backend/asgi.py.
+
+Django 4.1's ASGIHandler iterates streaming responses on the event loop,
+so a streamed export reading its MongoDB cursor (EmployeeExportView)
+would block every other request of the worker until it is done. This
+handler pulls the parts of streaming responses from a thread instead,
+STREAM_CHUNK_SIZE bytes at a time so the thread hops stay few.
+"""
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def next_chunk(parts):
+    """Join parts until STREAM_CHUNK_SIZE bytes, b'' once they are exhausted."""
+    chunk = []
+    size = 0
+    for part in parts:
+        chunk.append(part)
+        size += len(part)
+        if size >= STREAM_CHUNK_SIZE:
+            break
+    return b''.join(chunk)
+
+
+class StreamingASGIHandler(ASGIHandler):
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        # As ASGIHandler.send_response, but for the body
+        response_headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            response_headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            response_headers.append(
+                (b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+            )
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': response_headers,
+        })
+
+        parts = iter(response)
+        pull = sync_to_async(next_chunk, thread_sensitive=False)
+        while chunk := await pull(parts):
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body'})
+        await sync_to_async(response.close, thread_sensitive=True)()
+
+
+def get_asgi_application():
+    """django.core.asgi.get_asgi_application with StreamingASGIHandler."""
+    django.setup(set_prefix=False)
+    return StreamingASGIHandler()
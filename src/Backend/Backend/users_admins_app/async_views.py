@@ -0,0 +1,198 @@
+"""Async variants of the busiest endpoints, served instead of their APIView
+counterparts when settings.ASYNC_VIEWS is on, under ASGI.
+
+They answer the same requests with the same responses, but a request
+waiting on MongoDB (the MongoDB pool, see run_mongo), Cloudinary (httpx)
+or password hashing (the hashing pool) holds no worker thread, so one
+worker keeps many requests in flight.
+
+DRF views are sync only, the little of APIView these views need
+(authentication, permissions, parsing, error responses) is in AsyncAPIView.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotModified, QueryDict
+from django.http.multipartparser import MultiPartParserError
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotAuthenticated, ParseError, PermissionDenied, UnsupportedMediaType, ValidationError
+from rest_framework.settings import api_settings
+
+from .conditional import alist_etag, etag_matches
+from .fast_serializers import JSONResponse, employee_row_mapper, build_raw_account_email_map
+from .instrumentation import timing
+from .jwt_middleware import JWTAuthentication
+from .models import Account, Employee
+from .mongo import run_mongo
+from .pagination import paginate_keyset
+from .serializers import LoginCredentialsSerializer, EmployeeSerializer, EmployeeUpdateSerializer, EmployeeListQuerySerializer
+from .views import EMPLOYEE_PAGE_SIZE, filter_employees, login_response
+
+
+FORM_CONTENT_TYPES = ('application/x-www-form-urlencoded', 'multipart/form-data')
+
+
+async def read_data(request):
+    """request.data as DRF's JSON, form and multipart parsers build it."""
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body) if request.body else {}
+        except ValueError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+    if request.content_type not in FORM_CONTENT_TYPES:
+        if not request.META.get('CONTENT_LENGTH') or request.META['CONTENT_LENGTH'] == '0':
+            return {}
+        raise UnsupportedMediaType(request.content_type)
+
+    def parse():
+        if request.method == 'POST':
+            data, files = request.POST, request.FILES
+        elif request.content_type == 'multipart/form-data':
+            # Django only parses the bodies of POSTs, as DRF's parsers do
+            data, files = request.parse_file_upload(request.META, request)
+        else:
+            data, files = QueryDict(request.body, encoding=request.encoding), {}
+        data = data.copy()
+        data.update(files)
+        return data
+
+    # Multipart bodies are read, and big files spooled to disk, off the
+    # event loop
+    try:
+        return await sync_to_async(parse, thread_sensitive=False)()
+    except MultiPartParserError as exc:
+        raise ParseError(f'Multipart form parse error - {exc}')
+
+
+class AsyncAPIView(View):
+    """Authenticates with JWTAuthentication and requires the permission
+    attribute to be set on the user, like IsAuthenticated plus IsMaker or
+    IsChecker. Errors are answered the way DRF's exception handler does."""
+    authenticated = True
+    permission = None  # e.g. 'is_maker'
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Like APIView, authentication is by token and not by session
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            if self.authenticated:
+                request.user, _ = await JWTAuthentication().aauthenticate(request)
+                if self.permission and not getattr(request.user, self.permission):
+                    raise PermissionDenied()
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as exc:
+            return self.handle_exception(exc)
+
+    def handle_exception(self, exc):
+        headers = {}
+        if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+            headers['WWW-Authenticate'] = JWTAuthentication().authenticate_header(None)
+        if isinstance(exc.detail, (list, dict)):
+            data = exc.detail
+        else:
+            data = {'detail': exc.detail}
+        return JSONResponse(data, status=exc.status_code, headers=headers)
+
+
+class AsyncLoginView(AsyncAPIView):
+    authenticated = False
+
+    async def post(self, request, *args, **kwargs):
+        serializer = LoginCredentialsSerializer(data=await read_data(request))
+        serializer.is_valid(raise_exception=True)
+        credentials = serializer.validated_data
+
+        # Same checks and messages as LoginSerializer
+        user = await run_mongo(Account.find_by_email, credentials['email'])
+        if not user or not await user.acheck_password(credentials['password']):
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: ["Invalid credentials"]})
+
+        if not user.is_active:
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: ["User account is disabled"]})
+
+        await run_mongo(user.record_login)
+        return login_response(user)
+
+
+class AsyncEmployeeListView(AsyncAPIView):
+    async def get(self, request):
+        params = EmployeeListQuerySerializer(data=request.GET)
+        params.is_valid(raise_exception=True)
+        filters = params.validated_data
+
+        etag = await alist_etag(request.user.id)
+        if etag_matches(request, etag):
+            return HttpResponseNotModified(headers={'ETag': etag})
+
+        employees = filter_employees(request.user, filters).as_pymongo()
+        paginate = 'limit' in filters or 'cursor' in filters
+        if paginate:
+            employees, next_cursor = await run_mongo(
+                paginate_keyset,
+                employees,
+                filters.get('limit', EMPLOYEE_PAGE_SIZE),
+                filters.get('cursor')
+            )
+        else:
+            employees = await run_mongo(list, employees.order_by('-created_at', '-id'))
+
+        account_emails = await run_mongo(build_raw_account_email_map, employees)
+        with timing('serialize'):
+            to_row = employee_row_mapper(filters.get('fields'), account_emails)
+            rows = [to_row(employee) for employee in employees]
+            if paginate:
+                return JSONResponse({'results': rows, 'next_cursor': next_cursor}, headers={'ETag': etag})
+            return JSONResponse(rows, headers={'ETag': etag})
+
+
+class AsyncEmployeeUploadView(AsyncAPIView):
+    permission = 'is_maker'
+
+    async def post(self, request):
+        serializer = EmployeeSerializer(
+            data=await read_data(request),
+            context={'request': request}
+        )
+        if not serializer.is_valid():
+            return JSONResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer.instance = await serializer.acreate(serializer.validated_data)
+        return JSONResponse(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class AsyncEmployeeStatusUpdateView(AsyncAPIView):
+    async def patch(self, request, employee_id):
+        user = request.user
+        if not user.is_checker:
+            return JSONResponse(
+                {"error": "Only Checkers can update employee status"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        employee = await run_mongo(Employee.objects(id=employee_id).first)
+        if employee is None:
+            return JSONResponse({"error": "Employee not found"}, status=status.HTTP_404_NOT_FOUND)
+        # Only employees without checker_id need a query to tell
+        if employee.checker_id != user.id and not await run_mongo(employee.is_reviewable_by, user):
+            return JSONResponse(
+                {"error": "You are not authorized to update this employee's status"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        serializer = EmployeeUpdateSerializer(
+            employee,
+            data=await read_data(request),
+            partial=True,
+            context={'request': request}
+        )
+        if not serializer.is_valid():
+            return JSONResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        employee = await run_mongo(serializer.save)
+        # Employees saved before emails were denormalised dereference them
+        return JSONResponse(await run_mongo(lambda: EmployeeSerializer(employee).data))
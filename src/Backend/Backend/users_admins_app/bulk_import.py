@@ -0,0 +1,145 @@
+import csv
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.template.defaultfilters import filesizeformat
+from django.utils import timezone
+from mongoengine import ValidationError
+
+from .models import Employee, EmployeeCounter, CustomerStatus, ImportJob, ImportRowResult, ImportState
+from .uploads import upload_employee_files, upload_settings
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_COLUMNS = ('first_name', 'last_name', 'photo', 'resume')
+
+
+def run_import(job_id, manifest_path, archive_path):
+    """Import the employees listed in the manifest, one batch at a time.
+
+    Only a batch of rows and their extracted files exist at any time: the
+    manifest is read row by row and archive members are extracted to
+    temporary files right before they are uploaded.
+    """
+    job = ImportJob.objects.get(id=job_id)
+    ImportJob.objects(id=job_id).update_one(
+        set__state=ImportState.RUNNING,
+        set__updated_at=timezone.now()
+    )
+    config = upload_settings()
+
+    try:
+        with open(manifest_path, newline='', encoding='utf-8-sig') as manifest, \
+                zipfile.ZipFile(archive_path) as archive, \
+                ThreadPoolExecutor(max_workers=config['IMPORT_CONCURRENCY']) as pool:
+            reader = csv.DictReader(manifest)
+            missing = set(MANIFEST_COLUMNS) - set(reader.fieldnames or ())
+            if missing:
+                raise ValueError(f"Manifest is missing columns: {', '.join(sorted(missing))}")
+
+            members = {info.filename: info for info in archive.infolist()}
+            rows = enumerate(reader, start=1)
+            while True:
+                batch = list(islice(rows, config['IMPORT_BATCH_SIZE']))
+                if not batch:
+                    break
+                outcomes = list(pool.map(
+                    lambda item: _import_row(archive, members, job.created_by, *item),
+                    batch
+                ))
+                _save_batch(job_id, outcomes)
+    except Exception as e:
+        logger.exception('Employee import %s failed', job_id)
+        ImportJob.objects(id=job_id).update_one(
+            set__state=ImportState.FAILED,
+            set__error=str(e),
+            set__updated_at=timezone.now()
+        )
+    else:
+        ImportJob.objects(id=job_id).update_one(
+            set__state=ImportState.COMPLETE,
+            set__updated_at=timezone.now()
+        )
+    finally:
+        os.remove(manifest_path)
+        os.remove(archive_path)
+
+
+def _import_row(archive, members, maker, row_number, row):
+    """Validate, extract and upload one manifest row.
+
+    Returns (ImportRowResult, unsaved Employee or None).
+    """
+    employee = Employee(
+        first_name=(row.get('first_name') or '').strip() or None,
+        last_name=(row.get('last_name') or '').strip() or None,
+        uploaded_by=maker,
+        uploaded_by_email=maker.email,
+        checker_id=maker.created_by_id,
+        status=CustomerStatus.PENDING
+    )
+    errors = []
+    try:
+        employee.validate()
+    except ValidationError as e:
+        errors.extend(f'{field}: {error}' for field, error in e.to_dict().items())
+
+    limits = upload_settings()['MAX_FILE_SIZES']
+    for field in ('photo', 'resume'):
+        name = (row.get(field) or '').strip()
+        info = members.get(name)
+        if info is None:
+            errors.append(f'{field}: "{name}" is not in the archive.')
+        elif field in limits and info.file_size > limits[field]:
+            errors.append(f'{field}: File is larger than {filesizeformat(limits[field])}.')
+
+    if errors:
+        return ImportRowResult(row=row_number, errors=errors), None
+
+    photo_path = resume_path = None
+    try:
+        photo_path = _extract(archive, row['photo'].strip())
+        resume_path = _extract(archive, row['resume'].strip())
+        photo_result, resume_result = upload_employee_files(photo_path, resume_path)
+    except Exception as e:
+        logger.warning('Employee import row %s failed to upload: %s', row_number, e)
+        return ImportRowResult(row=row_number, errors=[f'Upload failed: {e}']), None
+    finally:
+        for path in (photo_path, resume_path):
+            if path:
+                os.remove(path)
+
+    employee.photo_url = photo_result['secure_url']
+    employee.photo_public_id = photo_result['public_id']
+    employee.resume_url = resume_result['secure_url']
+    employee.resume_public_id = resume_result['public_id']
+    return ImportRowResult(row=row_number, employee_id=employee.id), employee
+
+
+def _extract(archive, name):
+    suffix = os.path.splitext(name)[1]
+    with archive.open(name) as member, \
+            tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as extracted:
+        shutil.copyfileobj(member, extracted)
+    return extracted.name
+
+
+def _save_batch(job_id, outcomes):
+    employees = [employee for _, employee in outcomes if employee is not None]
+    if employees:
+        Employee.objects.insert(employees, load_bulk=False)
+        maker = employees[0].uploaded_by
+        EmployeeCounter.add(maker.id, maker.created_by_id, pending=len(employees))
+
+    ImportJob.objects(id=job_id).update_one(
+        push_all__results=[result for result, _ in outcomes],
+        inc__total_rows=len(outcomes),
+        inc__created_count=len(employees),
+        inc__failed_count=len(outcomes) - len(employees),
+        set__updated_at=timezone.now()
+    )
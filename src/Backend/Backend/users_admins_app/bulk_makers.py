@@ -0,0 +1,67 @@
+from itertools import islice
+
+from mongoengine import ValidationError
+from pymongo.errors import BulkWriteError
+
+from .hashers import hash_passwords
+from .models import Account, EmployeeCounter
+
+INSERT_BATCH_SIZE = 500
+
+DUPLICATE_KEY = 11000
+
+
+def provision_makers(checker, rows):
+    """Create a maker of the checker for each row, return a result per row.
+
+    rows are (row number, email, password) tuples. Passwords are hashed in
+    parallel on the hashing pool and the accounts inserted in unordered
+    batches, so a taken email only fails its own row.
+    """
+    results = {}
+    makers = []
+    seen = set()
+    for (row, email, _), password in zip(rows, hash_passwords([password for _, _, password in rows])):
+        email = Account.normalize_email(email)
+        maker = Account(
+            email=email,
+            username=email,
+            password=password,
+            created_by=checker,
+            is_maker=True
+        )
+        errors = []
+        if email in seen:
+            errors.append("email: Duplicate email in this request.")
+        try:
+            maker.validate()
+        except ValidationError as e:
+            errors.extend(f'{field}: {error}' for field, error in e.to_dict().items())
+        seen.add(email)
+
+        results[row] = {'row': row, 'email': email, 'id': None, 'errors': errors}
+        if not errors:
+            makers.append((row, maker))
+
+    makers = iter(makers)
+    collection = Account._get_collection()
+    while True:
+        batch = list(islice(makers, INSERT_BATCH_SIZE))
+        if not batch:
+            break
+        failed = {}
+        try:
+            collection.insert_many([maker.to_mongo() for _, maker in batch], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details['writeErrors']:
+                if error['code'] != DUPLICATE_KEY:
+                    raise
+                failed[error['index']] = "email: Email already exists."
+        for index, (row, maker) in enumerate(batch):
+            if index in failed:
+                results[row]['errors'].append(failed[index])
+            else:
+                results[row]['id'] = str(maker.id)
+
+    EmployeeCounter.touch(checker.id)
+    return [results[row] for row, _, _ in rows]
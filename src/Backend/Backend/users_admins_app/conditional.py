@@ -0,0 +1,27 @@
+from django.utils.cache import parse_etags
+
+from .models import EmployeeCounter
+from .mongo import run_mongo
+
+
+def list_etag(account_id):
+    """Weak ETag of the account's employee and maker lists.
+
+    Built from the version of the account's EmployeeCounter, a single
+    lookup by id, instead of from the lists themselves.
+    """
+    version = EmployeeCounter.objects(id=account_id).scalar('version').first() or 0
+    return f'W/"{account_id}-{version}"'
+
+
+async def alist_etag(account_id):
+    return await run_mongo(list_etag, account_id)
+
+
+def etag_matches(request, etag):
+    """Whether If-None-Match names the etag, with weak comparison."""
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or etag.removeprefix('W/') in (tag.removeprefix('W/') for tag in etags)
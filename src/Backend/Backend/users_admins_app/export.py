@@ -0,0 +1,47 @@
+"""Streamed employee exports, see EmployeeExportView.
+
+Employees are read from one cursor in batches of EXPORT_BATCH_SIZE and
+written out batch by batch, so memory stays flat whatever the number of
+employees and the first rows go out before the last ones are read.
+"""
+import csv
+from itertools import islice
+
+from .fast_serializers import build_raw_account_email_map, employee_row_mapper, render_json
+from .serializers import FetchEmployeeSerializer
+
+EXPORT_BATCH_SIZE = 500
+
+
+def iter_employee_rows(employees, fields=None, batch_size=None):
+    """Yield the response rows of a queryset of employees, one batch at a time."""
+    batch_size = batch_size or EXPORT_BATCH_SIZE
+    documents = iter(employees.as_pymongo().batch_size(batch_size))
+    while True:
+        batch = list(islice(documents, batch_size))
+        if not batch:
+            break
+        # Emails of references that are not denormalised, one query per batch
+        to_row = employee_row_mapper(fields, build_raw_account_email_map(batch))
+        for document in batch:
+            yield to_row(document)
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield render_json(row) + b'\n'
+
+
+class _Echo:
+    """File-like object whose write returns what it was given."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows, fields=None):
+    fields = [name for name in FetchEmployeeSerializer().fields if not fields or name in fields]
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(['' if row[name] is None else row[name] for name in fields])
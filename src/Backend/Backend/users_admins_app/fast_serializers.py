@@ -0,0 +1,142 @@
+"""Read path of the list endpoints that skips DRF's per-field machinery.
+
+Rows are built straight from raw pymongo documents (querysets with
+as_pymongo()) by mappers compiled once per request, and rendered with
+orjson. The output is byte for byte what FetchEmployeeSerializer and
+MakerSerializer rendered by JSONRenderer produce, which stay the
+reference for what the fields mean.
+"""
+import orjson
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import serializers
+
+from .instrumentation import timing
+from .models import Account, CustomerStatus, UploadState
+from .serializers import FetchEmployeeSerializer
+
+EMPLOYEE_DEFAULTS = {
+    'status': CustomerStatus.PENDING.value,
+    'upload_state': UploadState.COMPLETE.value,
+}
+
+
+def _text(key):
+    def text(doc):
+        value = doc.get(key)
+        return None if value is None else str(value)
+    return text
+
+
+def _datetime(key):
+    field = serializers.DateTimeField()
+    if timezone.get_current_timezone_name() == 'UTC':
+        # MongoDB returns naive UTC, which is what DRF renders with a Z
+        def datetime(doc):
+            value = doc.get(key)
+            if value is None:
+                return None
+            if value.tzinfo is None:
+                return value.isoformat() + 'Z'
+            return field.to_representation(value)
+    else:
+        def datetime(doc):
+            value = doc.get(key)
+            return None if value is None else field.to_representation(value)
+    return datetime
+
+
+def _enum_value(key):
+    default = EMPLOYEE_DEFAULTS[key]
+    return lambda doc: doc.get(key, default)
+
+
+def _account_email(key, account_emails):
+    email_key = f'{key}_email'
+
+    def email(doc):
+        value = doc.get(email_key)
+        if value:
+            return value
+        account_id = doc.get(key)
+        return None if account_id is None else account_emails.get(account_id)
+    return email
+
+
+def employee_row_mapper(fields=None, account_emails=None):
+    """Compile a function turning a raw employee into its response row.
+
+    fields and account_emails mean what they do for FetchEmployeeSerializer.
+    """
+    account_emails = account_emails or {}
+    getters = {
+        'id': _text('_id'),
+        'first_name': _text('first_name'),
+        'last_name': _text('last_name'),
+        'status': _enum_value('status'),
+        'uploaded_by': _account_email('uploaded_by', account_emails),
+        'checked_by': _account_email('checked_by', account_emails),
+        'created_at': _datetime('created_at'),
+        'updated_at': _datetime('updated_at'),
+        'photo_url': _text('photo_url'),
+        'resume_url': _text('resume_url'),
+        'photo_public_id': _text('photo_public_id'),
+        'resume_public_id': _text('resume_public_id'),
+        'upload_state': _enum_value('upload_state'),
+    }
+    # Same fields in the same order as the serializer
+    getters = [
+        (name, getters[name]) for name in FetchEmployeeSerializer().fields
+        if not fields or name in fields
+    ]
+
+    def to_row(doc):
+        return {name: getter(doc) for name, getter in getters}
+    return to_row
+
+
+def maker_row_mapper(employee_counts=None):
+    """Compile a function turning a raw maker account into its response row,
+    see MakerSerializer."""
+    def to_row(doc):
+        row = {
+            'id': str(doc['_id']),
+            'email': doc.get('email'),
+            'is_active': doc.get('is_active'),
+        }
+        if employee_counts is not None:
+            row['employee_counts'] = employee_counts.get(doc['_id'], dict.fromkeys(
+                [status.value for status in CustomerStatus], 0
+            ))
+        return row
+    return to_row
+
+
+def build_raw_account_email_map(docs):
+    """build_account_email_map for raw employees, whose references are ids."""
+    account_ids = set()
+    for doc in docs:
+        for key in ('uploaded_by', 'checked_by'):
+            if doc.get(key) is not None and not doc.get(f'{key}_email'):
+                account_ids.add(doc[key])
+
+    if not account_ids:
+        return {}
+
+    return dict(
+        Account.objects(id__in=list(account_ids)).scalar('id', 'email')
+    )
+
+
+def render_json(data):
+    """Render like DRF's JSONRenderer, compact and with raw unicode."""
+    # JSONRenderer escapes these two, which are valid JSON but not JavaScript
+    return orjson.dumps(data).replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class JSONResponse(HttpResponse):
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        with timing('serialize'):
+            content = render_json(data)
+        super().__init__(content, **kwargs)
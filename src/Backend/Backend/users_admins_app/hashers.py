@@ -0,0 +1,108 @@
+"""Password hashers whose cost parameters come from settings.PASSWORD_HASHING.
+
+They keep the algorithm names of Django's hashers, so existing hashes stay
+valid, and Django's check_password reports a hash made with other
+parameters as needing an update, which Account.check_password uses to
+rehash on login.
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+DEFAULTS = {
+    'PBKDF2_ITERATIONS': hashers.PBKDF2PasswordHasher.iterations,
+    'SCRYPT_WORK_FACTOR': hashers.ScryptPasswordHasher.work_factor,
+    'SCRYPT_BLOCK_SIZE': hashers.ScryptPasswordHasher.block_size,
+    'SCRYPT_PARALLELISM': hashers.ScryptPasswordHasher.parallelism,
+    'SCRYPT_MAXMEM': hashers.ScryptPasswordHasher.maxmem,
+    'ARGON2_TIME_COST': hashers.Argon2PasswordHasher.time_cost,
+    'ARGON2_MEMORY_COST': hashers.Argon2PasswordHasher.memory_cost,
+    'ARGON2_PARALLELISM': hashers.Argon2PasswordHasher.parallelism,
+    'BCRYPT_ROUNDS': hashers.BCryptSHA256PasswordHasher.rounds,
+    # Threads hashing at once, the rest of the requests wait their turn
+    'WORKERS': os.cpu_count(),
+}
+
+
+def hashing_setting(name):
+    return getattr(settings, 'PASSWORD_HASHING', {}).get(name, DEFAULTS[name])
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return hashing_setting('PBKDF2_ITERATIONS')
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return hashing_setting('SCRYPT_WORK_FACTOR')
+
+    @property
+    def block_size(self):
+        return hashing_setting('SCRYPT_BLOCK_SIZE')
+
+    @property
+    def parallelism(self):
+        return hashing_setting('SCRYPT_PARALLELISM')
+
+    @property
+    def maxmem(self):
+        return hashing_setting('SCRYPT_MAXMEM')
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """Needs the argon2-cffi package."""
+
+    @property
+    def time_cost(self):
+        return hashing_setting('ARGON2_TIME_COST')
+
+    @property
+    def memory_cost(self):
+        return hashing_setting('ARGON2_MEMORY_COST')
+
+    @property
+    def parallelism(self):
+        return hashing_setting('ARGON2_PARALLELISM')
+
+
+class BCryptSHA256PasswordHasher(hashers.BCryptSHA256PasswordHasher):
+    """Needs the bcrypt package."""
+
+    @property
+    def rounds(self):
+        return hashing_setting('BCRYPT_ROUNDS')
+
+
+@lru_cache(maxsize=None)
+def _hashing_executor():
+    return ThreadPoolExecutor(
+        max_workers=hashing_setting('WORKERS'),
+        thread_name_prefix='password-hashing'
+    )
+
+
+def run_hashing(func, *args):
+    """Run a hashing call on the bounded hashing pool and return its result.
+
+    hashlib releases the GIL while hashing, so the pool uses every core
+    while capping how many requests burn CPU on hashing at the same time.
+    Must not be called from within the pool itself.
+    """
+    return _hashing_executor().submit(func, *args).result()
+
+
+async def arun_hashing(func, *args):
+    """run_hashing for async views, the event loop is free while hashing."""
+    return await asyncio.wrap_future(_hashing_executor().submit(func, *args))
+
+
+def hash_passwords(passwords):
+    """Hash many passwords in parallel on the hashing pool, in order."""
+    return list(_hashing_executor().map(hashers.make_password, passwords))
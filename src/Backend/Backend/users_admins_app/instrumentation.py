@@ -0,0 +1,273 @@
+"""Per-request performance instrumentation, on with INSTRUMENTATION['ENABLED'].
+
+TimingMiddleware times every request, and how much of it went to MongoDB
+(reported by MongoCommandTimer, a pymongo command listener), to uploads
+and to serialization (the `timing` blocks). Each response gets them in a
+Server-Timing header and they feed per-route histograms, served in the
+Prometheus text format by MetricsView with the MongoDB pool and principal
+cache counters.
+
+Disabled, the middleware takes itself out of the stack and the listener
+is not registered, requests only pay for a context variable lookup in
+the `timing` blocks.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from pymongo import monitoring
+from rest_framework.renderers import JSONRenderer
+
+from .mongo import pool_stats
+from .principal_cache import get_principal_cache
+
+DEFAULTS = {
+    'ENABLED': False,
+    'SERVER_TIMING': True,
+    # Histogram upper bounds, in seconds
+    'BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    'MONGO_COMMAND_BUCKETS': (1, 2, 3, 5, 10, 20, 50, 100),
+}
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+def instrumentation_settings():
+    return {**DEFAULTS, **getattr(settings, 'INSTRUMENTATION', {})}
+
+
+class RequestTimings:
+    """Seconds spent per kind of work during one request."""
+
+    def __init__(self):
+        self.durations = {}
+        self.mongo_commands = 0
+        self._active = set()
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0) + seconds
+
+
+@contextmanager
+def collect_timings():
+    """Collect the timings of the work done in the block, see timing."""
+    timings = RequestTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timing(name):
+    """Count the time spent in the block as `name` work of the current request.
+
+    Nested blocks of the same name only count once.
+    """
+    timings = _current.get()
+    if timings is None or name in timings._active:
+        yield
+        return
+    timings._active.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings._active.discard(name)
+        timings.add(name, time.perf_counter() - start)
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Adds every MongoDB command to the timings of the request that sent it.
+
+    Listeners are called on the thread that sent the command, run_mongo
+    carries the request's context over to its pool.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        self._record(event)
+
+    def _record(self, event):
+        timings = _current.get()
+        if timings is not None:
+            timings.mongo_commands += 1
+            timings.add('mongo', event.duration_micros / 1e6)
+
+
+mongo_command_timer = MongoCommandTimer()
+
+
+class TimedJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timing('serialize'):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class Histogram:
+    """A Prometheus histogram with labels, cumulative buckets plus sum and count."""
+
+    def __init__(self, name, documentation, labels, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # One count per bucket, then the total count and the sum
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            all_series = sorted((labels, list(values)) for labels, values in self._series.items())
+        for label_values, values in all_series:
+            labels = _labels(self.labels, label_values)
+            for bound, count in zip(self.buckets, values):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {values[-2]}')
+            lines.append(f'{self.name}_count{{{labels}}} {values[-2]}')
+            lines.append(f'{self.name}_sum{{{labels}}} {values[-1]:.6f}')
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+def _labels(names, values):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for value in values)
+    return ','.join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+class Metrics:
+    """The per-route histograms of TimingMiddleware."""
+
+    def __init__(self):
+        buckets = instrumentation_settings()['BUCKETS']
+        self.requests = Histogram(
+            'checkmate_request_duration_seconds', 'Time to answer a request.',
+            ('route', 'method', 'status'), buckets
+        )
+        self.work = Histogram(
+            'checkmate_request_work_seconds', 'Time a request spent on mongo, upload or serialize work.',
+            ('route', 'method', 'work'), buckets
+        )
+        self.mongo_commands = Histogram(
+            'checkmate_request_mongo_commands', 'MongoDB commands sent by a request.',
+            ('route', 'method'), instrumentation_settings()['MONGO_COMMAND_BUCKETS']
+        )
+
+    def observe(self, route, method, status, total, timings):
+        self.requests.observe(total, route, method, status)
+        for work, seconds in timings.durations.items():
+            self.work.observe(seconds, route, method, work)
+        self.mongo_commands.observe(timings.mongo_commands, route, method)
+
+    def render(self):
+        lines = []
+        for histogram in (self.requests, self.work, self.mongo_commands):
+            lines.extend(histogram.render())
+        lines.extend(_pool_lines())
+        lines.extend(_principal_cache_lines())
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        for histogram in (self.requests, self.work, self.mongo_commands):
+            histogram.clear()
+
+
+POOL_GAUGES = {'open', 'checked_out'}
+
+
+def _pool_lines():
+    pools = pool_stats.stats()
+    lines = []
+    for counter in pool_stats.COUNTERS:
+        name = f'checkmate_mongodb_pool_{counter}'
+        kind = 'gauge' if counter in POOL_GAUGES else 'counter'
+        lines.append(f'# TYPE {name} {kind}')
+        for address, pool in sorted(pools.items()):
+            lines.append(f'{name}{{{_labels(("address",), (address,))}}} {pool[counter]}')
+    return lines
+
+
+def _principal_cache_lines():
+    # Lookups of this process, whatever the backend
+    lines = []
+    for counter, value in get_principal_cache().stats().items():
+        name = f'checkmate_principal_cache_{counter}'
+        lines.extend([f'# TYPE {name} counter', f'{name} {value}'])
+    return lines
+
+
+metrics = Metrics()
+
+
+class TimingMiddleware:
+    """Times requests for the Server-Timing header and the /metrics histograms.
+
+    Goes first in MIDDLEWARE so the time of the other middleware counts.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        config = instrumentation_settings()
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed()
+        self.server_timing = config['SERVER_TIMING']
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with collect_timings() as timings:
+            start = time.perf_counter()
+            response = self.get_response(request)
+        return self.finish(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        with collect_timings() as timings:
+            start = time.perf_counter()
+            response = await self.get_response(request)
+        return self.finish(request, response, timings, time.perf_counter() - start)
+
+    def finish(self, request, response, timings, total):
+        match = request.resolver_match
+        # Routes rather than paths keep the number of series bounded
+        route = match.route if match else 'unmatched'
+        metrics.observe(route, request.method, response.status_code, total, timings)
+
+        if self.server_timing:
+            entries = [f'total;dur={total * 1000:.2f}']
+            for name, seconds in timings.durations.items():
+                entry = f'{name};dur={seconds * 1000:.2f}'
+                if name == 'mongo':
+                    entry += f';desc="{timings.mongo_commands} commands"'
+                entries.append(entry)
+            response['Server-Timing'] = ', '.join(entries)
+        return response
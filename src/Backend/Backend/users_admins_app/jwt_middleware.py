@@ -1,55 +1,94 @@
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
 import jwt
-from django.conf import settings
 from .models import Account
+from .mongo import run_mongo
+from .principal_cache import PRINCIPAL_FIELDS, get_principal_cache
 
 class JWTAuthentication(BaseAuthentication):
+    """The only authenticator of the API.
+
+    Reads the access token from an `Authorization: Bearer` header or the
+    `access_token` cookie and verifies it once. Views that must be reachable
+    without a token (login, register, ...) opt out with
+    `authentication_classes = []` instead of being matched by path here.
+    """
+
     def authenticate(self, request):
-        # List of paths that don't require authentication
-        exempt_paths = [
-            '/user/register/', 
-            '/user/login/',
-            '/user/logout/',
-            '/user/admin-login/',
-            '/user/refresh-token/',
-            '/user/google-auth/',
-            '/user/verify-otp/',
-            '/user/resend-otp/',
-        ]
-
-        # Skip authentication for exempt paths
-        if any(request.path.endswith(path) for path in exempt_paths):
-            return None
-
-        # Get token from cookies
-        token = request.COOKIES.get('access_token')
+        user_id, jti = self.validate_token(request)
+
+        # Get user from the principal cache, falling back to the database
+        principal_cache = get_principal_cache()
+        principal = principal_cache.get(user_id, jti)
+        if principal is None:
+            principal = self.principal_queryset(user_id).first()
+            if principal is None:
+                raise AuthenticationFailed('User not found')
+            principal_cache.set(user_id, jti, principal)
+
+        return (self.get_user(principal), None)  # Authentication successful
+
+    async def aauthenticate(self, request):
+        """authenticate for async views, the database is queried on the MongoDB pool."""
+        user_id, jti = self.validate_token(request)
+
+        principal_cache = get_principal_cache()
+        principal = await principal_cache.aget(user_id, jti)
+        if principal is None:
+            principal = await run_mongo(self.principal_queryset(user_id).first)
+            if principal is None:
+                raise AuthenticationFailed('User not found')
+            await principal_cache.aset(user_id, jti, principal)
+
+        return (self.get_user(principal), None)
+
+    def validate_token(self, request):
+        """Decode and check the request's access token, return its user id and jti."""
+        token = self.get_raw_token(request)
         if not token:
             raise AuthenticationFailed('No authentication token provided')
 
         try:
             # Decode token
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-            user_id = payload.get('user_id')
-            
-            if not user_id:
-                raise AuthenticationFailed('Invalid token format')
-
-            # Get user from database
-            try:
-                user = Account.objects.get(id=user_id)
-                if not user.is_active:
-                    raise AuthenticationFailed('User account is disabled')
-                
-                return (user, None)  # Authentication successful
-                
-            except Account.DoesNotExist:
-                raise AuthenticationFailed('User not found')
-
+            payload = jwt.decode(
+                token,
+                api_settings.SIGNING_KEY,
+                algorithms=[api_settings.ALGORITHM]
+            )
         except jwt.ExpiredSignatureError:
             raise AuthenticationFailed('Token expired')
         except jwt.InvalidTokenError:
             raise AuthenticationFailed('Invalid token')
 
+        if payload.get(api_settings.TOKEN_TYPE_CLAIM) != 'access':
+            raise AuthenticationFailed('Invalid token')
+
+        user_id = payload.get(api_settings.USER_ID_CLAIM)
+        if not user_id:
+            raise AuthenticationFailed('Invalid token format')
+
+        return user_id, payload.get(api_settings.JTI_CLAIM)
+
+    def principal_queryset(self, user_id):
+        return Account.objects(id=user_id).only(*PRINCIPAL_FIELDS).as_pymongo()
+
+    def get_user(self, principal):
+        if not principal.get('is_active', True):
+            raise AuthenticationFailed('User account is disabled')
+
+        # Partially loaded account, like one fetched with .only()
+        return Account._from_son(principal)
+
+    def get_raw_token(self, request):
+        # The Authorization header wins over the cookie when both are sent
+        header = request.META.get('HTTP_AUTHORIZATION')
+        if header:
+            parts = header.split()
+            if len(parts) != 2 or parts[0] not in api_settings.AUTH_HEADER_TYPES:
+                raise AuthenticationFailed('Invalid authorization header')
+            return parts[1]
+        return request.COOKIES.get('access_token')
+
     def authenticate_header(self, request):
-        return 'Bearer'
\ No newline at end of file
+        return 'Bearer'
@@ -0,0 +1,63 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from users_admins_app.models import Account, Employee, EmployeeCounter
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill in the denormalised owner fields (checker_id, uploaded_by_email, checked_by_email) "
+        "of existing employees. Run it before serving the lists and reviews that filter on "
+        "checker_id: until then a checker's list leaves out the employees it fills in."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help="Number of accounts processed between progress reports."
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        # One update_many per maker covers all of their employees. The
+        # lists the updated employees show in get a new version, or clients
+        # would keep their copies from before the backfill
+        def backfill_maker(maker):
+            updated = Employee.objects(uploaded_by=maker.id).update(
+                set__checker_id=maker.created_by_id,
+                set__uploaded_by_email=maker.email
+            )
+            if updated:
+                EmployeeCounter.touch(maker.pk, maker.created_by_id)
+            return updated
+
+        def backfill_checker(checker):
+            updated = Employee.objects(checked_by=checker.id).update(
+                set__checked_by_email=checker.email
+            )
+            if updated:
+                makers = Employee._get_collection().distinct('uploaded_by', {'checked_by': checker.pk})
+                EmployeeCounter.touch(checker.pk, *makers)
+            return updated
+
+        updated = self.backfill('makers', Account.objects(is_maker=True), backfill_maker, batch_size)
+        updated += self.backfill('checkers', Account.objects(is_checker=True), backfill_checker, batch_size)
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {updated} employee fields."))
+
+    def backfill(self, label, accounts, backfill_account, batch_size):
+        accounts = accounts.only('id', 'email', 'created_by').no_dereference()
+        total = accounts.count()
+        processed = updated = 0
+
+        accounts = iter(accounts.batch_size(batch_size))
+        while True:
+            batch = list(islice(accounts, batch_size))
+            if not batch:
+                break
+            for account in batch:
+                updated += backfill_account(account)
+            processed += len(batch)
+            self.stdout.write(f"{processed}/{total} {label}, {updated} employees updated")
+        return updated
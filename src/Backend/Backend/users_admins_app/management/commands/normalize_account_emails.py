@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from mongoengine import NotUniqueError
+
+from users_admins_app.models import Account
+
+
+class Command(BaseCommand):
+    help = (
+        "Lowercase the emails of accounts created before emails were normalised. "
+        "Run it after deploying email normalisation: until then such accounts "
+        "can only log in with their email typed in its stored case."
+    )
+
+    def handle(self, *args, **options):
+        updated = conflicts = 0
+        for account in Account.objects(email__regex=r'[A-Z]|^\s|\s$'):
+            email = account.email
+            try:
+                # save() normalises the email and updates the employees' copies
+                account.save()
+            except NotUniqueError:
+                conflicts += 1
+                self.stderr.write(
+                    f"{email} ({account.id}) conflicts with {account.email}, left as is"
+                )
+            else:
+                updated += 1
+        self.stdout.write(self.style.SUCCESS(f"Normalised {updated} emails, {conflicts} conflicts."))
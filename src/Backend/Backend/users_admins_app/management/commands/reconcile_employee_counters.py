@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from pymongo import UpdateOne
+
+from users_admins_app.models import CustomerStatus, Employee, EmployeeCounter
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-maker and per-checker employee status counters from the employees."
+
+    def handle(self, *args, **options):
+        expected = {}
+        # One aggregation per owner field, each document counts once for
+        # its maker and once for its checker
+        for owner in ('uploaded_by', 'checker_id'):
+            pipeline = [
+                {'$match': {owner: {'$ne': None}}},
+                {'$group': {'_id': {'account': f'${owner}', 'status': '$status'}, 'count': {'$sum': 1}}},
+            ]
+            for row in Employee.objects.aggregate(pipeline):
+                counts = expected.setdefault(
+                    row['_id']['account'], dict.fromkeys([status.value for status in CustomerStatus], 0)
+                )
+                counts[row['_id']['status']] = row['count']
+
+        collection = EmployeeCounter._get_collection()
+        drifted = 0
+        for counter in collection.find():
+            counts = expected.get(counter['_id'], {})
+            if any(counter.get(status.value, 0) != counts.get(status.value, 0) for status in CustomerStatus):
+                drifted += 1
+            expected.setdefault(counter['_id'], dict.fromkeys([status.value for status in CustomerStatus], 0))
+
+        now = timezone.now()
+        # Bumping the version makes clients refetch lists that were cached
+        # with drifted counts
+        requests = [
+            UpdateOne(
+                {'_id': account_id},
+                {'$set': {**counts, 'updated_at': now}, '$inc': {'version': 1}},
+                upsert=True
+            )
+            for account_id, counts in expected.items()
+        ]
+        if requests:
+            collection.bulk_write(requests, ordered=False)
+        self.stdout.write(self.style.SUCCESS(
+            f"Reconciled {len(requests)} counters, {drifted} existing counters had drifted."
+        ))
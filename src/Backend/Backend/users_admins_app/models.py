@@ -1,8 +1,14 @@
-from mongoengine import Document, EmailField, StringField, BooleanField, DateTimeField, ReferenceField, UUIDField, EnumField, FileField
+from datetime import timedelta, timezone as dt_timezone
+from django.conf import settings
+from mongoengine import Document, EmbeddedDocument, EmailField, StringField, BooleanField, DateTimeField, ReferenceField, UUIDField, EnumField, FileField, IntField, ListField, EmbeddedDocumentListField
 from django.contrib.auth.hashers import make_password, check_password
 from django.utils import timezone
 import uuid
 import enum
+from mongoengine.queryset.visitor import Q
+from pymongo import ReturnDocument, UpdateOne
+from .principal_cache import get_principal_cache
+from .hashers import run_hashing, arun_hashing
 
 class Account(Document):
     id = UUIDField(primary_key=True, default=uuid.uuid4)
@@ -25,26 +31,145 @@ class Account(Document):
     is_staff = BooleanField(default=False)
     is_superuser = BooleanField(default=False)
 
+    # unique=True on email already creates its index, emails are stored
+    # lowercased so the unique index is case-insensitive
     meta = {
         'collection': 'accounts',
-        'indexes': ['email']
+        'indexes': [
+            # A checker's makers, newest first, see GetCheckerMakers
+            ('created_by', 'is_maker', '-date_joined', '-id'),
+        ]
     }
 
+    @staticmethod
+    def normalize_email(email):
+        return email.strip().lower() if email else email
+
+    @classmethod
+    def find_by_email(cls, email):
+        """The account of an email typed in any case, or None.
+
+        Accounts saved before emails were normalised keep their mixed case
+        until normalize_account_emails has run, until then a miss of the
+        normalised email falls back to a case-insensitive match, which
+        cannot use the email index.
+        """
+        normalized = cls.normalize_email(email)
+        account = cls.objects(email=normalized).first()
+        if account is None and normalized:
+            account = cls.objects(email__iexact=normalized).first()
+        return account
+
     def set_password(self, raw_password):
-        self.password = make_password(raw_password)
+        self.password = run_hashing(make_password, raw_password)
 
     def check_password(self, raw_password):
-        return check_password(raw_password, self.password)
+        return run_hashing(check_password, raw_password, self.password, self._rehash)
+
+    async def acheck_password(self, raw_password):
+        return await arun_hashing(check_password, raw_password, self.password, self._rehash)
+
+    def _rehash(self, raw_password):
+        # Called on the hashing pool when the stored hash uses another
+        # hasher or outdated parameters, only the password is written
+        self.password = make_password(raw_password)
+        Account.objects(id=self.pk).update_one(set__password=self.password)
 
     def save(self, *args, **kwargs):
+        self.email = self.normalize_email(self.email)
         if not self.username:
             self.username = self.email
-        return super().save(*args, **kwargs)
+        created = self._created
+        changed_fields = set() if created else set(self._get_changed_fields())
+        previous_checker_id = None
+        if 'created_by' in changed_fields:
+            # The previous checker loses this maker from its lists, only
+            # the stored document still knows who that was
+            stored = Account._get_collection().find_one({'_id': self.pk}, {'created_by': 1}) or {}
+            previous_checker_id = stored.get('created_by')
+        result = super().save(*args, **kwargs)
+        get_principal_cache().invalidate(self.pk)
+        reviewed_makers = self._sync_employees(changed_fields, previous_checker_id)
+        if created:
+            # A new account has empty lists, only its checker's makers changed
+            EmployeeCounter.touch(self.created_by_id)
+        elif changed_fields & {'email', 'is_active', 'created_by'}:
+            # These show in the lists of the account and of its checker, and
+            # a checker's email in the lists of the makers it reviewed
+            EmployeeCounter.touch(self.pk, self.created_by_id, previous_checker_id, *reviewed_makers)
+        return result
+
+    def _sync_employees(self, changed_fields, previous_checker_id=None):
+        """Keep the copies of this account's fields on Employee up to date,
+        return the ids of the makers whose employees it reviewed, when their
+        copy of its email changed."""
+        reviewed_makers = []
+        if 'email' in changed_fields:
+            Employee.objects(uploaded_by=self.pk).update(set__uploaded_by_email=self.email)
+            if Employee.objects(checked_by=self.pk).update(set__checked_by_email=self.email):
+                reviewed_makers = Employee._get_collection().distinct('uploaded_by', {'checked_by': self.pk})
+        if 'created_by' in changed_fields:
+            Employee.objects(uploaded_by=self.pk).update(set__checker_id=self.created_by_id)
+            # The maker's employees move to the new checker's counts
+            counts = {
+                group['_id']: group['count']
+                for group in Employee.objects(uploaded_by=self.pk).aggregate([
+                    {'$group': {'_id': '$status', 'count': {'$sum': 1}}}
+                ])
+            }
+            if counts:
+                EmployeeCounter.apply({
+                    previous_checker_id: {status: -count for status, count in counts.items()},
+                    self.created_by_id: counts,
+                })
+        return reviewed_makers
+
+    def delete(self, *args, **kwargs):
+        super().delete(*args, **kwargs)
+        get_principal_cache().invalidate(self.pk)
+        EmployeeCounter.touch(self.created_by_id)
+
+    def deactivate(self):
+        # Targeted update, the cached principal must not outlive it
+        Account.objects(id=self.pk).update_one(set__is_active=False)
+        self.is_active = False
+        get_principal_cache().invalidate(self.pk)
+        EmployeeCounter.touch(self.pk, self.created_by_id)
+
+    def record_login(self):
+        """Set last_login with one conditional $set.
+
+        The write is skipped when last_login is more recent than
+        settings.LAST_LOGIN_GRANULARITY seconds, so frequent logins of the
+        same account cost no write at all.
+        """
+        now = timezone.now()
+        granularity = timedelta(seconds=getattr(settings, 'LAST_LOGIN_GRANULARITY', 0))
+        last_login = self.last_login
+        if last_login is not None and timezone.is_naive(last_login):
+            # Datetimes read back from MongoDB are naive UTC
+            last_login = timezone.make_aware(last_login, dt_timezone.utc)
+        if last_login is not None and now - last_login < granularity:
+            return False
+        updated = Account.objects(id=self.pk).filter(
+            Q(last_login=None) | Q(last_login__lte=now - granularity)
+        ).update_one(set__last_login=now)
+        if updated:
+            self.last_login = now
+        return bool(updated)
 
     @property
     def is_authenticated(self):
         return True
 
+    @property
+    def created_by_id(self):
+        # Id of the creating checker without dereferencing it
+        created_by = self._data.get('created_by')
+        if created_by is None:
+            return None
+        return created_by.pk if isinstance(created_by, Document) else created_by.id
+
     @classmethod
     def create_user(cls, email, password=None, **extra_fields):
         if not email:
@@ -53,7 +178,8 @@ class Account(Document):
         user = cls(email=email, **extra_fields)
         if password:
             user.set_password(password)
-        user.save()
+        # A single insert, a taken email raises NotUniqueError from the index
+        user.save(force_insert=True)
         return user
 
     @classmethod
@@ -74,7 +200,7 @@ class Account(Document):
         extra_fields['is_maker'] = True
         user = cls(email=email, created_by=created_by, **extra_fields)
         user.set_password(password)
-        user.save()
+        user.save(force_insert=True)
         return user
 
     @classmethod
@@ -84,7 +210,8 @@ class Account(Document):
         user = cls(email=email, **extra_fields)
         if password:
             user.set_password(password)
-        user.save()
+        # A single insert, a taken email raises NotUniqueError from the index
+        user.save(force_insert=True)
         return user
 
     def __str__(self):
@@ -95,16 +222,28 @@ class CustomerStatus(enum.Enum):
     APPROVED = 'approved'
     DECLINED = 'declined'
 
+class UploadState(enum.Enum):
+    PENDING = 'pending'
+    COMPLETE = 'complete'
+    FAILED = 'failed'
+
 class Employee(Document):
     id = StringField(primary_key=True, default=lambda: str(uuid.uuid4()))
     first_name = StringField(max_length=100, required=True)
     last_name = StringField(max_length=100, required=True)
-    photo_url = StringField(required=True)
-    photo_public_id = StringField(required=True)
-    resume_url = StringField(required=True)
-    resume_public_id = StringField(required=True)
+    # Filled in by the background upload when uploads are deferred
+    photo_url = StringField()
+    photo_public_id = StringField()
+    resume_url = StringField()
+    resume_public_id = StringField()
+    upload_state = EnumField(UploadState, default=UploadState.COMPLETE)
     uploaded_by = ReferenceField(Account, required=True)  # Maker who uploaded
     checked_by = ReferenceField(Account, required=False)  # Checker who reviewed
+    # Denormalised from the referenced accounts so that listing and
+    # reviewing never has to resolve them, kept in sync by Account.save
+    checker_id = UUIDField()  # uploaded_by.created_by, the checker allowed to review
+    uploaded_by_email = EmailField()
+    checked_by_email = EmailField()
     status = EnumField(CustomerStatus, default=CustomerStatus.PENDING)
     
     created_at = DateTimeField(default=timezone.now)
@@ -113,7 +252,13 @@ class Employee(Document):
     meta = {
         'collection': 'employees',
         'indexes': [
-            'uploaded_by',
+            # Keyset pagination of a maker's employees, with and without
+            # a status filter
+            ('uploaded_by', '-created_at', '-id'),
+            ('uploaded_by', 'status', '-created_at', '-id'),
+            # Same for all employees under a checker
+            ('checker_id', '-created_at', '-id'),
+            ('checker_id', 'status', '-created_at', '-id'),
             'checked_by',
             'status'
         ]
@@ -123,5 +268,159 @@ class Employee(Document):
         self.updated_at = timezone.now()
         return super().save(*args, **kwargs)
 
+    @property
+    def uploaded_by_id(self):
+        # Id of the uploading maker without dereferencing it
+        return self._reference_id('uploaded_by')
+
+    @property
+    def checked_by_id(self):
+        return self._reference_id('checked_by')
+
+    def _reference_id(self, name):
+        reference = self._data.get(name)
+        if reference is None:
+            return None
+        return reference.pk if isinstance(reference, Document) else reference.id
+
+    @classmethod
+    def reviewable_by(cls, checker):
+        """The employees `checker` may review, those of their makers.
+
+        Employees saved before checker_id was denormalised, which the
+        backfill_employee_owners command has not reached yet, are matched
+        through their maker instead.
+        """
+        makers = list(Account.objects(created_by=checker.id).scalar('id'))
+        return cls.objects(Q(checker_id=checker.id) | Q(checker_id=None, uploaded_by__in=makers))
+
+    def is_reviewable_by(self, checker):
+        """Whether `checker` may review the employee, as reviewable_by."""
+        if self.checker_id is not None:
+            return self.checker_id == checker.id
+        return bool(Account.objects(id=self.uploaded_by_id, created_by=checker.id).count())
+
+    def transition_status(self, status, checker):
+        """Review the employee: move it from the status it has here to
+        `status`, as reviewed by `checker`, and return the updated employee.
+
+        A single find_one_and_update that $sets the fields that change and
+        updated_at, without validating or sending the rest of the document.
+        It is a compare-and-set on the current status and on the employee
+        belonging to the checker, a concurrent review in between makes it
+        match nothing and return None instead of being overwritten. An
+        employee without checker_id must have been checked with
+        is_reviewable_by, it gets the checker's id filled in.
+        """
+        changes = {'updated_at': timezone.now()}
+        if checker.id != self.checker_id:
+            changes['checker_id'] = checker.id
+        if status != self.status:
+            changes['status'] = status
+        if checker.id != self.checked_by_id:
+            changes['checked_by'] = checker
+        if checker.email != self.checked_by_email:
+            changes['checked_by_email'] = checker.email
+
+        fields = self._fields
+        document = self._get_collection().find_one_and_update(
+            {
+                '_id': self.id,
+                fields['checker_id'].db_field: {'$in': [fields['checker_id'].to_mongo(checker.id), None]},
+                fields['status'].db_field: fields['status'].to_mongo(self.status),
+            },
+            {'$set': {fields[name].db_field: fields[name].to_mongo(value) for name, value in changes.items()}},
+            return_document=ReturnDocument.AFTER
+        )
+        return None if document is None else self._from_son(document)
+
     def __str__(self):
-        return f"{self.first_name} {self.last_name}"
\ No newline at end of file
+        return f"{self.first_name} {self.last_name}"
+
+class EmployeeCounter(Document):
+    """Number of employees per status of an account, kept up to date with
+    $inc on every creation and review so the totals are a single read.
+
+    A maker's counter covers the employees they uploaded, a checker's the
+    employees of all of their makers. The reconcile_employee_counters
+    command rebuilds them from the employees.
+
+    version is bumped on every write the account's employee and maker lists
+    depend on, it is what their ETags are made of.
+    """
+    id = UUIDField(primary_key=True)  # Account id
+    pending = IntField(default=0)
+    approved = IntField(default=0)
+    declined = IntField(default=0)
+    version = IntField(default=0)
+    updated_at = DateTimeField(default=timezone.now)
+
+    meta = {
+        'collection': 'employee_counters'
+    }
+
+    @classmethod
+    def add(cls, maker_id, checker_id, **deltas):
+        """Add deltas, keyed by status value, to a maker's and their checker's counters."""
+        cls.apply({maker_id: deltas, checker_id: deltas})
+
+    @classmethod
+    def touch(cls, *account_ids):
+        """Bump the version of the accounts' lists without changing counts."""
+        cls.apply({account_id: {} for account_id in account_ids})
+
+    @classmethod
+    def apply(cls, changes):
+        """Apply {account_id: {status value: delta}} and bump the versions, in one bulk write."""
+        now = timezone.now()
+        requests = []
+        for account_id, deltas in changes.items():
+            if account_id is None:
+                continue
+            deltas = {status: delta for status, delta in deltas.items() if delta}
+            requests.append(UpdateOne(
+                {'_id': cls._fields['id'].to_mongo(account_id)},
+                {'$inc': {**deltas, 'version': 1}, '$set': {'updated_at': now}},
+                upsert=True
+            ))
+        if requests:
+            cls._get_collection().bulk_write(requests, ordered=False)
+
+    def as_dict(self):
+        counts = {status.value: getattr(self, status.value) for status in CustomerStatus}
+        counts['total'] = sum(counts.values())
+        return counts
+
+class ImportState(enum.Enum):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    COMPLETE = 'complete'
+    FAILED = 'failed'
+
+class ImportRowResult(EmbeddedDocument):
+    row = IntField(required=True)  # 1-based, not counting the CSV header
+    employee_id = StringField()
+    errors = ListField(StringField())
+
+class ImportJob(Document):
+    """A bulk employee import from a CSV manifest and a ZIP of files."""
+    id = StringField(primary_key=True, default=lambda: str(uuid.uuid4()))
+    created_by = ReferenceField(Account, required=True)  # Maker who imported
+    state = EnumField(ImportState, default=ImportState.PENDING)
+    error = StringField()  # Why the whole job failed, row errors are in results
+    total_rows = IntField(default=0)
+    created_count = IntField(default=0)
+    failed_count = IntField(default=0)
+    results = EmbeddedDocumentListField(ImportRowResult)
+
+    created_at = DateTimeField(default=timezone.now)
+    updated_at = DateTimeField(default=timezone.now)
+
+    meta = {
+        'collection': 'import_jobs',
+        'indexes': ['created_by']
+    }
+
+    def save(self, *args, **kwargs):
+        self.updated_at = timezone.now()
+        return super().save(*args, **kwargs)
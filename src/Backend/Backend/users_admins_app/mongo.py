@@ -0,0 +1,138 @@
+"""The MongoDB connection, configured by settings.MONGODB.
+
+The connection is only registered at startup, the client is created and
+connects on the first query, so processes that never query (most manage.py
+commands) never open one.
+
+Async views await the same connection through run_mongo.
+"""
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from mongoengine import register_connection
+from mongoengine.connection import get_connection
+from pymongo import monitoring
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Keeps connection pool counters per server, for monitoring."""
+
+    COUNTERS = ('open', 'checked_out', 'created', 'closed', 'checkouts', 'checkout_failures')
+
+    def __init__(self):
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def stats(self):
+        with self._lock:
+            return {f'{host}:{port}': dict(pool) for (host, port), pool in self._pools.items()}
+
+    def _add(self, address, **deltas):
+        with self._lock:
+            pool = self._pools.setdefault(address, dict.fromkeys(self.COUNTERS, 0))
+            for counter, delta in deltas.items():
+                pool[counter] += delta
+
+    def pool_created(self, event):
+        self._add(event.address)
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._pools.pop(event.address, None)
+
+    def connection_created(self, event):
+        self._add(event.address, open=1, created=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add(event.address, open=-1, closed=1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._add(event.address, checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        self._add(event.address, checked_out=1, checkouts=1)
+
+    def connection_checked_in(self, event):
+        self._add(event.address, checked_out=-1)
+
+
+pool_stats = PoolStatsListener()
+
+
+def register_mongodb():
+    from .instrumentation import instrumentation_settings, mongo_command_timer
+    from .query_budget import command_recorder, query_budget_settings
+
+    config = settings.MONGODB
+    event_listeners = [pool_stats]
+    if instrumentation_settings()['ENABLED']:
+        # Command events are only published when a listener wants them
+        event_listeners.append(mongo_command_timer)
+    if query_budget_settings()['ENABLED']:
+        event_listeners.append(command_recorder)
+    register_connection(
+        alias='default',
+        db=config['NAME'],
+        host=config['HOST'],
+        connect=False,
+        event_listeners=event_listeners,
+        **config['OPTIONS']
+    )
+
+
+def ping_mongodb(timeout):
+    """Raise unless the server answers a ping within timeout seconds.
+
+    The ping runs on a daemon thread so a probe gives up after timeout
+    instead of waiting for the client's server selection timeout, and an
+    unanswered ping does not hold up the process exiting.
+    """
+    outcome = {}
+
+    def ping():
+        try:
+            get_connection().admin.command('ping')
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=ping, name='mongodb-ping', daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise TimeoutError(f'MongoDB did not answer within {timeout} seconds')
+    if 'error' in outcome:
+        raise outcome['error']
+
+
+@lru_cache(maxsize=None)
+def _mongo_executor():
+    # As many threads as the connection pool has connections, more would
+    # only wait for one
+    return ThreadPoolExecutor(
+        max_workers=settings.MONGODB['OPTIONS'].get('maxPoolSize') or 100,
+        thread_name_prefix='mongodb'
+    )
+
+
+async def run_mongo(func, *args, **kwargs):
+    """Run blocking MongoEngine or pymongo calls for an async view.
+
+    They run on the MongoDB pool, the way Motor runs the driver, and the
+    event loop serves other requests meanwhile.
+    """
+    # In the request's context, for the instrumentation
+    context = contextvars.copy_context()
+    return await asyncio.wrap_future(_mongo_executor().submit(context.run, func, *args, **kwargs))
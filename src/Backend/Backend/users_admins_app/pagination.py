@@ -0,0 +1,46 @@
+import base64
+import json
+from datetime import datetime
+
+from mongoengine.queryset.visitor import Q
+from rest_framework.exceptions import ValidationError
+
+
+def encode_cursor(value, pk):
+    payload = json.dumps([value.isoformat(), str(pk)])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(value), pk
+    except (ValueError, TypeError):
+        raise ValidationError({'cursor': 'Invalid cursor.'})
+
+
+def paginate_keyset(queryset, limit, cursor=None, field='created_at'):
+    """Return one page of queryset ordered newest first, and the next cursor.
+
+    Pages are keyed on (field, id) so fetching a deep page is an index range
+    scan of `limit` documents rather than a skip over everything before it.
+    """
+    queryset = queryset.order_by(f'-{field}', '-id')
+    if cursor:
+        value, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': pk})
+        )
+
+    # Fetch one extra row to know whether there is a next page
+    page = list(queryset.limit(limit + 1))
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        last = page[-1]
+        if isinstance(last, dict):
+            # as_pymongo() querysets
+            next_cursor = encode_cursor(last[field], last['_id'])
+        else:
+            next_cursor = encode_cursor(getattr(last, field), last.id)
+    return page, next_cursor
@@ -0,0 +1,204 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+
+# Account fields the views read from request.user
+PRINCIPAL_FIELDS = ('id', 'email', 'is_maker', 'is_checker', 'is_active', 'created_by')
+
+
+class BasePrincipalCache:
+    """Caches the account fields of an authenticated user per (user id, token jti).
+
+    Values are the raw account documents restricted to PRINCIPAL_FIELDS, so a
+    hit costs no database round-trip at all.
+    """
+
+    def __init__(self, timeout=60):
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, user_id, jti):
+        principal = self._get(str(user_id), jti)
+        with self._stats_lock:
+            if principal is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return principal
+
+    def set(self, user_id, jti, principal):
+        self._set(str(user_id), jti, principal)
+
+    async def aget(self, user_id, jti):
+        # Backends that do network I/O are run off the event loop
+        return await sync_to_async(self.get, thread_sensitive=False)(user_id, jti)
+
+    async def aset(self, user_id, jti, principal):
+        await sync_to_async(self.set, thread_sensitive=False)(user_id, jti, principal)
+
+    def invalidate(self, user_id):
+        """Drop every cached principal of the user, whatever the token."""
+        self._invalidate(str(user_id))
+
+    def stats(self):
+        with self._stats_lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def clear(self):
+        with self._stats_lock:
+            self.hits = 0
+            self.misses = 0
+
+    def _get(self, user_id, jti):
+        raise NotImplementedError
+
+    def _set(self, user_id, jti, principal):
+        raise NotImplementedError
+
+    def _invalidate(self, user_id):
+        raise NotImplementedError
+
+
+class LocalPrincipalCache(BasePrincipalCache):
+    """In-process LRU with a TTL per entry.
+
+    Invalidation only reaches the current process, in a multi-process
+    deployment other workers keep serving an entry until its timeout.
+    """
+
+    def __init__(self, timeout=60, max_entries=1024):
+        super().__init__(timeout)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (user_id, jti) -> (expires_at, principal)
+        self._tokens = {}  # user_id -> set of jti, to invalidate without a scan
+        self._lock = threading.Lock()
+
+    async def aget(self, user_id, jti):
+        # In memory, a thread hop would cost more than the lookup
+        return self.get(user_id, jti)
+
+    async def aset(self, user_id, jti, principal):
+        self.set(user_id, jti, principal)
+
+    def _get(self, user_id, jti):
+        key = (user_id, jti)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, principal = entry
+            if expires_at <= time.monotonic():
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+            return principal
+
+    def _set(self, user_id, jti, principal):
+        key = (user_id, jti)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, principal)
+            self._entries.move_to_end(key)
+            self._tokens.setdefault(user_id, set()).add(jti)
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+
+    def _invalidate(self, user_id):
+        with self._lock:
+            for jti in list(self._tokens.get(user_id, ())):
+                self._discard((user_id, jti))
+
+    def _discard(self, key):
+        user_id, jti = key
+        self._entries.pop(key, None)
+        tokens = self._tokens.get(user_id)
+        if tokens is not None:
+            tokens.discard(jti)
+            if not tokens:
+                del self._tokens[user_id]
+
+    def clear(self):
+        super().clear()
+        with self._lock:
+            self._entries.clear()
+            self._tokens.clear()
+
+
+class DjangoPrincipalCache(BasePrincipalCache):
+    """Principal cache on a Django cache alias, e.g. Redis shared by all workers.
+
+    Each user has a version number in the cache that is part of the entry
+    key, invalidating bumps it so every token's entry is orphaned at once.
+    A generation number, also in every entry key, does the same for all
+    users on clear(), leaving the rest of the cache alias alone.
+    """
+
+    def __init__(self, timeout=60, alias='default'):
+        super().__init__(timeout)
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    GENERATION_KEY = 'principal-generation'
+
+    def _version_key(self, user_id):
+        return f'principal-version:{user_id}'
+
+    def _entry_key(self, user_id, jti, generation, version):
+        return f'principal:{generation}:{user_id}:{version}:{jti}'
+
+    def _get(self, user_id, jti):
+        version_key = self._version_key(user_id)
+        keys = self.cache.get_many([self.GENERATION_KEY, version_key])
+        if version_key not in keys:
+            return None
+        generation = keys.get(self.GENERATION_KEY, 1)
+        return self.cache.get(self._entry_key(user_id, jti, generation, keys[version_key]))
+
+    def _set(self, user_id, jti, principal):
+        version_key = self._version_key(user_id)
+        self.cache.add(version_key, 1, timeout=None)
+        keys = self.cache.get_many([self.GENERATION_KEY, version_key])
+        generation = keys.get(self.GENERATION_KEY, 1)
+        version = keys.get(version_key, 1)
+        self.cache.set(self._entry_key(user_id, jti, generation, version), principal, self.timeout)
+
+    def _invalidate(self, user_id):
+        try:
+            self.cache.incr(self._version_key(user_id))
+        except ValueError:
+            # No version yet means nothing has been cached for the user
+            pass
+
+    def clear(self):
+        super().clear()
+        # Orphans every principal entry, the alias may hold other data
+        self.cache.add(self.GENERATION_KEY, 1, timeout=None)
+        self.cache.incr(self.GENERATION_KEY)
+
+
+@lru_cache(maxsize=None)
+def get_principal_cache():
+    config = getattr(settings, 'PRINCIPAL_CACHE', {})
+    backend = import_string(
+        config.get('BACKEND', 'users_admins_app.principal_cache.LocalPrincipalCache')
+    )
+    return backend(**config.get('OPTIONS', {}))
+
+
+def _reset_principal_cache(setting, **kwargs):
+    if setting == 'PRINCIPAL_CACHE':
+        get_principal_cache.cache_clear()
+
+
+setting_changed.connect(_reset_principal_cache)
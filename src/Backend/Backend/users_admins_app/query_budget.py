@@ -0,0 +1,207 @@
+"""Budgets of MongoDB commands, for tests and for development servers.
+
+capture_commands() records the commands sent while it is open, and
+max_commands() fails when a block of code or a test goes over a budget,
+like Django's assertNumQueries. Commands are reported by CommandRecorder,
+a pymongo command listener, or for mongomock, which has no command events,
+by patching its collections with record_mongomock_commands().
+
+QueryBudgetMiddleware logs a warning for every request that goes over
+QUERY_BUDGET['MAX_COMMANDS'] or sends the same command more than once,
+the usual sign of a query per row.
+"""
+import contextvars
+import logging
+from collections import Counter
+from contextlib import ContextDecorator, contextmanager
+from unittest import mock
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from bson import json_util
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'MAX_COMMANDS': 10,
+}
+
+# Parts of a command the driver adds, which differ between identical queries
+DRIVER_FIELDS = {'lsid', '$clusterTime', '$db', '$readPreference', 'txnNumber', 'signature'}
+
+# mongomock collection methods that cost a round-trip on a real server
+ROUND_TRIP_METHODS = (
+    'find', 'find_one', 'aggregate', 'count_documents', 'distinct',
+    'insert_one', 'insert_many', 'update_one', 'update_many', 'bulk_write',
+    'find_one_and_update', 'delete_one', 'delete_many',
+)
+
+_logs = contextvars.ContextVar('mongo_command_logs', default=())
+
+
+def query_budget_settings():
+    return {**DEFAULTS, **getattr(settings, 'QUERY_BUDGET', {})}
+
+
+class CommandLog:
+    def __init__(self):
+        self.commands = []
+
+    @property
+    def count(self):
+        return len(self.commands)
+
+    def repeated(self):
+        """{command: times} of the commands sent more than once."""
+        return {command: times for command, times in Counter(self.commands).items() if times > 1}
+
+    def __str__(self):
+        return '\n'.join(f'{number}. {command}' for number, command in enumerate(self.commands, 1))
+
+
+def record_command(name, collection, spec):
+    for log in _logs.get():
+        log.commands.append(f'{name} {collection} {spec}')
+
+
+@contextmanager
+def capture_commands():
+    """Record the MongoDB commands sent in the block, in a CommandLog.
+
+    Commands sent from other threads only count when the thread runs in
+    the block's context, like run_mongo's pool.
+    """
+    log = CommandLog()
+    token = _logs.set(_logs.get() + (log,))
+    try:
+        yield log
+    finally:
+        _logs.reset(token)
+
+
+class max_commands(ContextDecorator):
+    """Fail when the block sends more than `limit` MongoDB commands, or,
+    unless allow_repeats, sends the same one twice."""
+
+    def __init__(self, limit, allow_repeats=True):
+        self.limit = limit
+        self.allow_repeats = allow_repeats
+
+    def __enter__(self):
+        self._capture = capture_commands()
+        self.log = self._capture.__enter__()
+        return self.log
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._capture.__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return False
+        if self.log.count > self.limit:
+            raise AssertionError(
+                f'{self.log.count} MongoDB commands sent, {self.limit} allowed:\n{self.log}'
+            )
+        if not self.allow_repeats and self.log.repeated():
+            raise AssertionError(f'MongoDB commands sent more than once:\n{self.log}')
+        return False
+
+
+class CommandRecorder(monitoring.CommandListener):
+    """Reports the commands sent to a MongoDB server to capture_commands."""
+
+    def started(self, event):
+        if not _logs.get():
+            return
+        command = {key: value for key, value in event.command.items() if key not in DRIVER_FIELDS}
+        record_command(
+            event.command_name,
+            command.pop(event.command_name, ''),
+            json_util.dumps(command, sort_keys=True)
+        )
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+command_recorder = CommandRecorder()
+
+
+@contextmanager
+def record_mongomock_commands():
+    """Report the collection calls made against mongomock, which has no
+    command listeners, to capture_commands while the block runs."""
+    from mongomock.collection import Collection
+
+    depth = contextvars.ContextVar('mongomock_depth', default=0)
+
+    def counted(name, original):
+        def wrapper(collection, *args, **kwargs):
+            # mongomock implements find_one on top of find, only the
+            # outermost call is a round-trip
+            if not depth.get():
+                record_command(name, collection.name, repr((args, sorted(kwargs.items()))))
+            token = depth.set(depth.get() + 1)
+            try:
+                return original(collection, *args, **kwargs)
+            finally:
+                depth.reset(token)
+        return wrapper
+
+    patchers = [
+        mock.patch.object(Collection, name, autospec=True, side_effect=counted(name, getattr(Collection, name)))
+        for name in ROUND_TRIP_METHODS
+    ]
+    for patcher in patchers:
+        patcher.start()
+    try:
+        yield
+    finally:
+        for patcher in patchers:
+            patcher.stop()
+
+
+class QueryBudgetMiddleware:
+    """Warns about requests over the MongoDB command budget, when enabled."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        config = query_budget_settings()
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed()
+        self.max_commands = config['MAX_COMMANDS']
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with capture_commands() as log:
+            response = self.get_response(request)
+        self.check(request, log)
+        return response
+
+    async def __acall__(self, request):
+        with capture_commands() as log:
+            response = await self.get_response(request)
+        self.check(request, log)
+        return response
+
+    def check(self, request, log):
+        if log.count > self.max_commands:
+            logger.warning(
+                '%s %s sent %d MongoDB commands, over the budget of %d:\n%s',
+                request.method, request.path, log.count, self.max_commands, log
+            )
+        for command, times in log.repeated().items():
+            logger.warning(
+                '%s %s sent the same MongoDB command %d times: %s',
+                request.method, request.path, times, command
+            )
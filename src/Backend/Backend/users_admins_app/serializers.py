@@ -1,13 +1,19 @@
 import email
-from rest_framework import serializers
-from .models import Account, Employee, CustomerStatus
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+from .models import Account, Employee, EmployeeCounter, CustomerStatus, UploadState, ImportJob
+from .uploads import upload_employee_files, aupload_employee_files, schedule_employee_upload, upload_settings, run_in_background, spool_upload
+from .mongo import run_mongo
+from .bulk_import import run_import
+from .bulk_makers import provision_makers
+import csv
+import io
+import zipfile
+from itertools import islice
 from django.contrib.auth import authenticate
 from mongoengine.queryset.visitor import Q
-from django.utils import timezone
-from mongoengine import ValidationError
+from mongoengine import ValidationError, NotUniqueError
 from django.conf import settings
-import cloudinary
-import cloudinary.uploader
 
 
 class RegisterSerializer(serializers.Serializer):
@@ -16,26 +22,25 @@ class RegisterSerializer(serializers.Serializer):
     
     def create(self, validated_data):
         # Create a checker user directly using the Account class method
-        user = Account.create_checker(
-            email=validated_data['email'],
-            password=validated_data['password']
-        )
+        try:
+            user = Account.create_checker(
+                email=validated_data['email'],
+                password=validated_data['password']
+            )
+        except NotUniqueError:
+            raise serializers.ValidationError({'email': ["Email already exists."]})
         return user
     
-    def validate_email(self, value):
-        # Use MongoEngine query syntax
-        if Account.objects(email=value).first():
-            raise serializers.ValidationError("Email already exists.")
-        return value
-    
 
-class LoginSerializer(serializers.Serializer):
+class LoginCredentialsSerializer(serializers.Serializer):
     email = serializers.EmailField()
     password = serializers.CharField()
 
+
+class LoginSerializer(LoginCredentialsSerializer):
     def validate(self, data):
         # Find the user by email
-        user = Account.objects(email=data['email']).first()
+        user = Account.find_by_email(data['email'])
         
         if not user or not user.check_password(data['password']):
             raise serializers.ValidationError("Invalid credentials")
@@ -44,8 +49,7 @@ class LoginSerializer(serializers.Serializer):
             raise serializers.ValidationError("User account is disabled")
         
         # Update last login
-        user.last_login = timezone.now()
-        user.save()
+        user.record_login()
         
         return {
             'email': data['email'],
@@ -64,22 +68,89 @@ class MakerRegisterSerializer(serializers.Serializer):
         if not checker:
             raise serializers.ValidationError("Checker information is required")
             
-        user = Account.create_maker(
-            email=validated_data['email'],
-            password=validated_data['password'],
-            created_by=checker
-        )
+        try:
+            user = Account.create_maker(
+                email=validated_data['email'],
+                password=validated_data['password'],
+                created_by=checker
+            )
+        except NotUniqueError:
+            raise serializers.ValidationError({'email': ["Email already exists."]})
         return user
-    
-    def validate_email(self, value):
-        if Account.objects(email=value).first():
-            raise serializers.ValidationError("Email already exists.")
-        return value
+
+class MakerRowSerializer(serializers.Serializer):
+    email = serializers.EmailField()
+    password = serializers.CharField()
+
+
+class MakerBulkRegisterSerializer(serializers.Serializer):
+    """Makers to create, as a JSON list or a CSV file with email,password columns."""
+    MAX_MAKERS = 1000
+
+    makers = serializers.ListField(child=serializers.DictField(), required=False, max_length=MAX_MAKERS)
+    file = serializers.FileField(write_only=True, required=False)
+
+    def validate_file(self, value):
+        reader = csv.DictReader(io.TextIOWrapper(value, encoding='utf-8-sig', newline=''))
+        missing = {'email', 'password'} - set(reader.fieldnames or ())
+        if missing:
+            raise serializers.ValidationError(f"CSV is missing columns: {', '.join(sorted(missing))}")
+        rows = list(islice(reader, self.MAX_MAKERS + 1))
+        if len(rows) > self.MAX_MAKERS:
+            raise serializers.ValidationError(f"CSV has more than {self.MAX_MAKERS} makers.")
+        return rows
+
+    def validate(self, data):
+        if ('makers' in data) == ('file' in data):
+            raise serializers.ValidationError("Provide either makers or file.")
+        return {'makers': data.get('makers', data.get('file'))}
+
+    def create(self, validated_data):
+        checker = self.context['checker']
+
+        # Rows are validated one by one so that a bad row only fails itself
+        results = {}
+        rows = []
+        for row, data in enumerate(validated_data['makers'], start=1):
+            maker = MakerRowSerializer(data=data)
+            if maker.is_valid():
+                rows.append((row, maker.validated_data['email'], maker.validated_data['password']))
+            else:
+                results[row] = {
+                    'row': row,
+                    'email': data.get('email'),
+                    'id': None,
+                    'errors': [f'{field}: {error}' for field, errors in maker.errors.items() for error in errors],
+                }
+
+        for result in provision_makers(checker, rows):
+            results[result['row']] = result
+        return [results[row] for row in sorted(results)]
+
 
 class MakerSerializer(serializers.Serializer):
     id = serializers.CharField()
     email = serializers.EmailField()
     is_active = serializers.BooleanField()
+    employee_counts = serializers.SerializerMethodField()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Only rendered when the view computed them, see build_employee_counts
+        if 'employee_counts' not in self.context:
+            self.fields.pop('employee_counts')
+
+    def get_employee_counts(self, obj):
+        return self.context['employee_counts'].get(obj.id, dict.fromkeys(
+            [status.value for status in CustomerStatus], 0
+        ))
+
+
+class MakerListQuerySerializer(serializers.Serializer):
+    """Query parameters accepted by the makers endpoint."""
+    counts = serializers.BooleanField(required=False, default=False)
+    cursor = serializers.CharField(required=False)
+    limit = serializers.IntegerField(required=False, min_value=1, max_value=100)
 
 class EmployeeSerializer(serializers.Serializer):
     id = serializers.CharField(read_only=True)
@@ -90,13 +161,21 @@ class EmployeeSerializer(serializers.Serializer):
     photo_url = serializers.CharField(read_only=True)
     resume_url = serializers.CharField(read_only=True)
     status = serializers.CharField(read_only=True, default=CustomerStatus.PENDING.value)
+    upload_state = serializers.SerializerMethodField(read_only=True)
     uploaded_by_email = serializers.SerializerMethodField(read_only=True)
     checked_by_email = serializers.SerializerMethodField(read_only=True)
 
+    def get_upload_state(self, obj):
+        return obj.upload_state.value
+
     def get_uploaded_by_email(self, obj):
+        if obj.uploaded_by_email:
+            return obj.uploaded_by_email
         return obj.uploaded_by.email if obj.uploaded_by else None
 
     def get_checked_by_email(self, obj):
+        if obj.checked_by_email:
+            return obj.checked_by_email
         return obj.checked_by.email if obj.checked_by else None
 
     def create(self, validated_data):
@@ -105,22 +184,44 @@ class EmployeeSerializer(serializers.Serializer):
         if not user.is_maker:
             raise serializers.ValidationError("Only Makers can upload employees")
 
-        # Upload photo to Cloudinary
-        photo_result = cloudinary.uploader.upload(
+        if upload_settings()['DEFERRED']:
+            # Save right away and let a background worker upload the files
+            employee = Employee(
+                first_name=validated_data['first_name'],
+                last_name=validated_data['last_name'],
+                uploaded_by=user,
+                uploaded_by_email=user.email,
+                checker_id=user.created_by_id,
+                status=CustomerStatus.PENDING,
+                upload_state=UploadState.PENDING
+            )
+            employee.save()
+            EmployeeCounter.add(user.id, user.created_by_id, pending=1)
+            schedule_employee_upload(employee.id, validated_data['photo'], validated_data['resume'])
+            return employee
+
+        # Upload photo and resume concurrently
+        photo_result, resume_result = upload_employee_files(
             validated_data['photo'],
-            folder="employees/photos",
-            resource_type="image"
+            validated_data['resume']
         )
+        return self.save_uploaded(user, validated_data, photo_result, resume_result)
+
+    async def acreate(self, validated_data):
+        """create for async views, the uploads are awaited on the event loop."""
+        user = self.context['request'].user
 
-        # Upload resume to Cloudinary
-        resume_result = cloudinary.uploader.upload(
-            validated_data['resume'],
-            folder="employees/resumes",
-            resource_type="raw",
-            type="upload",
-            access_type="public"  # Use access_type instead of access_mode
+        if not user.is_maker or upload_settings()['DEFERRED']:
+            # Nothing to wait for but MongoDB and the local disk
+            return await run_mongo(self.create, validated_data)
+
+        photo_result, resume_result = await aupload_employee_files(
+            validated_data['photo'],
+            validated_data['resume']
         )
+        return await run_mongo(self.save_uploaded, user, validated_data, photo_result, resume_result)
 
+    def save_uploaded(self, user, validated_data, photo_result, resume_result):
         employee = Employee(
             first_name=validated_data['first_name'],
             last_name=validated_data['last_name'],
@@ -129,12 +230,111 @@ class EmployeeSerializer(serializers.Serializer):
             resume_url=resume_result['secure_url'],
             resume_public_id=resume_result['public_id'],
             uploaded_by=user,
+            uploaded_by_email=user.email,
+            checker_id=user.created_by_id,
             status=CustomerStatus.PENDING
         )
         employee.save()
+        EmployeeCounter.add(user.id, user.created_by_id, pending=1)
         return employee
 
 
+class EmployeeImportSerializer(serializers.Serializer):
+    manifest = serializers.FileField(write_only=True)  # CSV: first_name,last_name,photo,resume
+    archive = serializers.FileField(write_only=True)  # ZIP holding the files named in the manifest
+
+    def validate_archive(self, value):
+        if not zipfile.is_zipfile(value):
+            raise serializers.ValidationError("Archive must be a ZIP file.")
+        value.seek(0)
+        return value
+
+    def create(self, validated_data):
+        user = self.context['request'].user
+
+        if not user.is_maker:
+            raise serializers.ValidationError("Only Makers can upload employees")
+
+        job = ImportJob(created_by=user)
+        job.save()
+        # The request's files are gone once it is answered, keep copies
+        run_in_background(
+            run_import,
+            job.id,
+            spool_upload(validated_data['manifest']),
+            spool_upload(validated_data['archive'])
+        )
+        return job
+
+
+class ImportRowResultSerializer(serializers.Serializer):
+    row = serializers.IntegerField()
+    employee_id = serializers.CharField()
+    errors = serializers.ListField(child=serializers.CharField())
+
+
+class ImportJobSerializer(serializers.Serializer):
+    id = serializers.CharField()
+    state = serializers.SerializerMethodField()
+    error = serializers.CharField()
+    total_rows = serializers.IntegerField()
+    created_count = serializers.IntegerField()
+    failed_count = serializers.IntegerField()
+    results = ImportRowResultSerializer(many=True)
+    created_at = serializers.DateTimeField()
+    updated_at = serializers.DateTimeField()
+
+    def get_state(self, obj):
+        return obj.state.value
+
+
+def build_account_email_map(employees):
+    """Resolve the uploaded_by/checked_by references that have no
+    denormalised email yet (not backfilled) in one accounts query.
+
+    Expects employees loaded with no_dereference() so the references are
+    still DBRefs; returns {account_id: email}.
+    """
+    account_ids = set()
+    for employee in employees:
+        if employee.uploaded_by is not None and not employee.uploaded_by_email:
+            account_ids.add(employee.uploaded_by.id)
+        if employee.checked_by is not None and not employee.checked_by_email:
+            account_ids.add(employee.checked_by.id)
+
+    if not account_ids:
+        return {}
+
+    return dict(
+        Account.objects(id__in=list(account_ids)).scalar('id', 'email')
+    )
+
+
+def build_employee_counts(checker_id, maker_ids):
+    """Count the employees of each maker per status in one aggregation.
+
+    Returns {maker_id: {status: count}} with every status present.
+    """
+    counts = {
+        maker_id: dict.fromkeys([status.value for status in CustomerStatus], 0)
+        for maker_id in maker_ids
+    }
+    if not counts:
+        return counts
+
+    pipeline = [
+        {'$group': {
+            '_id': {'maker': '$uploaded_by', 'status': '$status'},
+            'count': {'$sum': 1},
+        }},
+    ]
+    # checker_id narrows the match to the checker's employees on its index
+    employees = Employee.objects(checker_id=checker_id, uploaded_by__in=list(counts))
+    for row in employees.aggregate(pipeline):
+        counts[row['_id']['maker']][row['_id']['status']] = row['count']
+    return counts
+
+
 class FetchEmployeeSerializer(serializers.Serializer):
     id = serializers.CharField()
     first_name = serializers.CharField()
@@ -148,15 +348,89 @@ class FetchEmployeeSerializer(serializers.Serializer):
     resume_url = serializers.CharField()
     photo_public_id = serializers.CharField()
     resume_public_id = serializers.CharField()
+    upload_state = serializers.SerializerMethodField()
+
+    def __init__(self, *args, **kwargs):
+        # Optional subset of fields to render, see EmployeeListQuerySerializer
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
     def get_status(self, obj):
         return obj.status.value
 
+    def get_upload_state(self, obj):
+        return obj.upload_state.value
+
     def get_uploaded_by(self, obj):
-        return obj.uploaded_by.email if obj.uploaded_by else None
+        return obj.uploaded_by_email or self._account_email(obj.uploaded_by)
 
     def get_checked_by(self, obj):
-        return obj.checked_by.email if obj.checked_by else None
+        return obj.checked_by_email or self._account_email(obj.checked_by)
+
+    def _account_email(self, ref):
+        if not ref:
+            return None
+        # Use the prefetched id -> email map when the view provides one,
+        # otherwise fall back to dereferencing the document
+        account_emails = self.context.get('account_emails')
+        if account_emails is None:
+            return ref.email
+        return account_emails.get(ref.id)
+
+
+class EmployeeBulkStatusSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.CharField(),
+        min_length=1,
+        max_length=1000
+    )
+    status = serializers.ChoiceField(
+        choices=[status.value for status in CustomerStatus]
+    )
+
+    def validate_ids(self, value):
+        # Drop duplicates, keep the order for the per-id results
+        return list(dict.fromkeys(value))
+
+
+class EmployeeListQuerySerializer(serializers.Serializer):
+    """Query parameters accepted by the employee list endpoint."""
+    status = serializers.ChoiceField(
+        choices=[status.value for status in CustomerStatus],
+        required=False
+    )
+    uploaded_by = serializers.UUIDField(required=False)
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+    fields = serializers.CharField(required=False)
+    cursor = serializers.CharField(required=False)
+    limit = serializers.IntegerField(required=False, min_value=1, max_value=100)
+
+    def validate_fields(self, value):
+        fields = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = set(fields) - set(FetchEmployeeSerializer().fields)
+        if unknown:
+            raise serializers.ValidationError(
+                f"Unknown fields: {', '.join(sorted(unknown))}"
+            )
+        return fields
+
+
+class EmployeeExportQuerySerializer(EmployeeListQuerySerializer):
+    """Query parameters accepted by the employee export endpoint."""
+    # Not format, which DRF reserves for picking a renderer
+    output = serializers.ChoiceField(choices=['ndjson', 'csv'], default='ndjson')
+    cursor = None
+    limit = None
+
+
+class ReviewConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Employee was reviewed concurrently, reload it and try again."
+    default_code = 'review_conflict'
 
 
 class EmployeeUpdateSerializer(serializers.Serializer):
@@ -173,13 +447,24 @@ class EmployeeUpdateSerializer(serializers.Serializer):
         if not user.is_checker:
             raise serializers.ValidationError("Only Checkers can update employee status")
         
+        if 'status' not in validated_data:
+            return instance
+
         # Convert string status to Enum
         status_value = validated_data['status']
         try:
             status_enum = CustomerStatus(status_value)
-            instance.status = status_enum
-            instance.checked_by = user
-            instance.save()
-            return instance
         except ValueError:
-            raise serializers.ValidationError(f"Invalid status value: {status_value}")
\ No newline at end of file
+            raise serializers.ValidationError(f"Invalid status value: {status_value}")
+
+        # Compare-and-set on the status the checker was shown
+        employee = instance.transition_status(status_enum, user)
+        if employee is None:
+            raise ReviewConflict()
+        # Even with the same status the review changed updated_at and maybe
+        # checked_by, the versions of both lists move either way
+        deltas = {}
+        if status_enum != instance.status:
+            deltas = {instance.status.value: -1, status_enum.value: 1}
+        EmployeeCounter.add(employee.uploaded_by_id, employee.checker_id, **deltas)
+        return employee
\ No newline at end of file
@@ -1,3 +1,1344 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import tempfile
+import threading
+import zipfile
+from datetime import timedelta
+from unittest import mock
+
+import httpx
+import mongomock
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import AsyncClient, AsyncRequestFactory, RequestFactory, SimpleTestCase, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.urls import path
+from django.utils import timezone
+from mongoengine import connect, disconnect
+from mongoengine.queryset import QuerySet
+from pymongo import monitoring
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .asgi import StreamingASGIHandler
+from .async_views import AsyncLoginView, AsyncEmployeeListView, AsyncEmployeeUploadView, AsyncEmployeeStatusUpdateView
+from .models import Account, Employee, EmployeeCounter, CustomerStatus, UploadState
+from .serializers import (
+    EmployeeUpdateSerializer, FetchEmployeeSerializer, MakerSerializer, ReviewConflict,
+    build_account_email_map, build_employee_counts
+)
+from .fast_serializers import build_raw_account_email_map, employee_row_mapper, maker_row_mapper, render_json
+from .instrumentation import collect_timings, metrics, mongo_command_timer
+from .mongo import PoolStatsListener, run_mongo
+from .principal_cache import DjangoPrincipalCache, get_principal_cache
+from .query_budget import QueryBudgetMiddleware, capture_commands, max_commands, record_mongomock_commands
+from .uploads import CloudinaryUploader, wait_for_pending_uploads
+from .views import get_tokens_for_user
 
 # Create your tests here.
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class MongoTestCase(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        disconnect()
+        connect('checkmate_test', mongo_client_class=mongomock.MongoClient)
+        cls.enterClassContext(record_mongomock_commands())
+
+    @classmethod
+    def tearDownClass(cls):
+        disconnect()
+        super().tearDownClass()
+
+    def setUp(self):
+        Account.drop_collection()
+        Employee.drop_collection()
+        EmployeeCounter.drop_collection()
+        get_principal_cache().clear()
+        self.client = APIClient()
+
+    def login(self, user):
+        self.client.cookies['access_token'] = get_tokens_for_user(user)['access']
+
+    def create_employee(self, maker, **extra_fields):
+        employee = Employee(**{
+            'first_name': 'Jane',
+            'last_name': 'Doe',
+            'photo_url': 'https://example.com/photo.jpg',
+            'photo_public_id': 'employees/photos/photo',
+            'resume_url': 'https://example.com/resume.pdf',
+            'resume_public_id': 'employees/resumes/resume',
+            'uploaded_by': maker,
+            'uploaded_by_email': maker.email,
+            'checker_id': maker.created_by_id,
+            **extra_fields
+        })
+        employee.save()
+        return employee
+
+
+class EmployeeListViewTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.checker = Account.create_checker(email='checker@example.com', password='secret')
+        self.makers = [
+            Account.create_maker(email=f'maker{i}@example.com', password='secret', created_by=self.checker)
+            for i in range(3)
+        ]
+
+    def list_employees(self):
+        with capture_commands() as queries:
+            response = self.client.get('/user/employees/')
+        self.assertEqual(response.status_code, 200)
+        return response, queries.count
+
+    def test_checker_sees_emails_of_uploader_and_reviewer(self):
+        employee = self.create_employee(
+            self.makers[0], checked_by=self.checker, status=CustomerStatus.APPROVED
+        )
+        self.login(self.checker)
+
+        response, _ = self.list_employees()
+
+        self.assertEqual(len(response.json()), 1)
+        row = response.json()[0]
+        self.assertEqual(row['id'], employee.id)
+        self.assertEqual(row['status'], 'approved')
+        self.assertEqual(row['uploaded_by'], 'maker0@example.com')
+        self.assertEqual(row['checked_by'], 'checker@example.com')
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.login(self.checker)
+        self.create_employee(self.makers[0], checked_by=self.checker)
+        # Warm the principal cache so both measurements skip the auth lookup
+        self.list_employees()
+        _, baseline = self.list_employees()
+
+        for i in range(30):
+            self.create_employee(self.makers[i % 3], checked_by=self.checker)
+        response, queries = self.list_employees()
+
+        self.assertEqual(len(response.json()), 31)
+        self.assertEqual(queries, baseline)
+
+    def test_checker_list_is_a_single_query_once_backfilled(self):
+        self.login(self.checker)
+        for i in range(5):
+            self.create_employee(
+                self.makers[i % 3], checked_by=self.checker, checked_by_email=self.checker.email
+            )
+        self.list_employees()
+
+        response, queries = self.list_employees()
+
+        self.assertEqual(len(response.json()), 5)
+        self.assertEqual({row['checked_by'] for row in response.json()}, {'checker@example.com'})
+        # The list version for the ETag, and the employees
+        self.assertEqual(queries, 2)
+
+    def test_maker_list_uses_constant_queries(self):
+        maker = self.makers[0]
+        self.login(maker)
+        for _ in range(10):
+            self.create_employee(maker, checked_by=self.checker)
+
+        response, queries = self.list_employees()
+
+        self.assertEqual(len(response.json()), 10)
+        self.assertTrue(all(row['uploaded_by'] == maker.email for row in response.json()))
+        # accounts lookup for the auth, list version, employees, and the
+        # batched reference lookup
+        self.assertLessEqual(queries, 4)
+
+    def test_cursor_pagination_walks_every_employee_once(self):
+        self.login(self.checker)
+        created = [self.create_employee(self.makers[i % 3]) for i in range(7)]
+
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 3}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get('/user/employees/', params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(row['id'] for row in response.json()['results'])
+            cursor = response.json()['next_cursor']
+            if not cursor:
+                break
+
+        self.assertEqual(sorted(seen), sorted(e.id for e in created))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_filters_and_field_projection(self):
+        self.login(self.checker)
+        self.create_employee(self.makers[0], status=CustomerStatus.APPROVED)
+        self.create_employee(self.makers[0])
+        self.create_employee(self.makers[1], status=CustomerStatus.APPROVED)
+
+        response = self.client.get('/user/employees/', {
+            'status': 'approved',
+            'uploaded_by': str(self.makers[0].id),
+            'fields': 'id,status,uploaded_by',
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+        self.assertEqual(
+            dict(response.json()[0]),
+            {'id': response.json()[0]['id'], 'status': 'approved', 'uploaded_by': 'maker0@example.com'}
+        )
+
+    def test_invalid_cursor_is_rejected(self):
+        self.login(self.checker)
+        response = self.client.get('/user/employees/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class EmployeeExportViewTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.checker = Account.create_checker(email='checker@example.com', password='secret')
+        self.maker = Account.create_maker(email='maker@example.com', password='secret', created_by=self.checker)
+        self.employees = [self.create_employee(self.maker) for _ in range(5)]
+        self.create_employee(self.maker, uploaded_by_email=None, status=CustomerStatus.APPROVED)
+        self.login(self.checker)
+
+    def test_ndjson_export_streams_in_batches(self):
+        with mock.patch('users_admins_app.export.EXPORT_BATCH_SIZE', 2):
+            response = self.client.get('/user/employees/export/', {'status': 'pending'})
+            self.assertTrue(response.streaming)
+            lines = b''.join(response.streaming_content).splitlines()
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            self.client.get('/user/employees/', {'status': 'pending'}).json()
+        )
+
+    def test_csv_export_has_a_header_and_a_row_per_employee(self):
+        response = self.client.get('/user/employees/export/', {'output': 'csv', 'fields': 'id,uploaded_by'})
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(rows[0], ['id', 'uploaded_by'])
+        self.assertEqual(len(rows), 7)
+        # The email of the employee that is not backfilled is looked up
+        self.assertEqual({row[1] for row in rows[1:]}, {'maker@example.com'})
+
+
+class FastSerializerTests(MongoTestCase):
+    """The list endpoints' row mappers must render exactly what the DRF
+    serializers rendered."""
+
+    def setUp(self):
+        super().setUp()
+        self.checker = Account.create_checker(email='checker@example.com', password='secret')
+        self.maker = Account.create_maker(email='maker@example.com', password='secret', created_by=self.checker)
+        self.create_employee(self.maker, first_name='Zoë\u2028"Quoted"', checked_by=self.checker,
+                             checked_by_email=self.checker.email, status=CustomerStatus.APPROVED)
+        # Not backfilled, the uploader's email has to be looked up
+        self.create_employee(self.maker, uploaded_by_email=None, upload_state=UploadState.PENDING,
+                             photo_url=None, resume_url=None)
+
+    def assertSameJSON(self, fields=None):
+        documents = list(Employee.objects.order_by('-created_at', '-id').no_dereference())
+        expected = JSONRenderer().render(FetchEmployeeSerializer(
+            documents, many=True, fields=fields,
+            context={'account_emails': build_account_email_map(documents)}
+        ).data)
+
+        raw = list(Employee.objects.order_by('-created_at', '-id').as_pymongo())
+        to_row = employee_row_mapper(fields, build_raw_account_email_map(raw))
+        self.assertEqual(render_json([to_row(doc) for doc in raw]), expected)
+
+    def test_employee_rows_match_the_serializer(self):
+        self.assertSameJSON()
+        self.assertSameJSON(fields=['status', 'checked_by', 'created_at'])
+
+    def test_maker_rows_match_the_serializer(self):
+        makers = list(Account.objects(is_maker=True))
+        counts = build_employee_counts(self.checker.id, [maker.id for maker in makers])
+        expected = JSONRenderer().render(
+            MakerSerializer(makers, many=True, context={'employee_counts': counts}).data
+        )
+
+        to_row = maker_row_mapper(counts)
+        rows = [to_row(doc) for doc in Account.objects(is_maker=True).as_pymongo()]
+        self.assertEqual(render_json(rows), expected)
+
+
+class GetCheckerMakersTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.checker = Account.create_checker(email='checker@example.com', password='secret')
+        self.makers = [
+            Account.create_maker(email=f'maker{number}@example.com', password='secret', created_by=self.checker)
+            for number in range(3)
+        ]
+        self.login(self.checker)
+
+    def test_makers_are_paginated(self):
+        response = self.client.get('/user/fetch-makers/', {'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+
+        response = self.client.get('/user/fetch-makers/', {'cursor': response.json()['next_cursor']})
+        self.assertEqual(len(response.json()['results']), 1)
+        self.assertIsNone(response.json()['next_cursor'])
+
+    def test_counts_are_aggregated_in_one_query(self):
+        self.create_employee(self.makers[0])
+        self.create_employee(self.makers[0], status=CustomerStatus.APPROVED)
+        self.create_employee(self.makers[1], status=CustomerStatus.DECLINED)
+        self.client.get('/user/fetch-makers/')
+
+        with capture_commands() as queries:
+            response = self.client.get('/user/fetch-makers/', {'counts': 'true'})
+
+        self.assertEqual(response.status_code, 200)
+        # list version, makers and the counts aggregation
+        self.assertEqual(queries.count, 3)
+        counts = {maker['email']: maker['employee_counts'] for maker in response.json()}
+        self.assertEqual(counts['maker0@example.com'], {'pending': 1, 'approved': 1, 'declined': 0})
+        self.assertEqual(counts['maker1@example.com'], {'pending': 0, 'approved': 0, 'declined': 1})
+        self.assertEqual(counts['maker2@example.com'], {'pending': 0, 'approved': 0, 'declined': 0})
+
+
+class ConditionalListTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.checker = Account.create_checker(email='checker@example.com', password='secret')
+        self.maker = Account.create_maker(email='maker@example.com', password='secret', created_by=self.checker)
+        self.login(self.checker)
+
+    def test_unchanged_list_is_not_modified(self):
+        for url in ('/user/employees/', '/user/fetch-makers/'):
+            etag = self.client.get(url)['ETag']
+            with capture_commands() as queries:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(queries.count, 1)
+
+    def test_writes_change_the_etag(self):
+        employee = self.create_employee(self.maker)
+        etag = self.client.get('/user/employees/')['ETag']
+
+        self.client.patch(f'/user/employees/{employee.id}/status/', {'status': 'approved'}, format='json')
+        response = self.client.get('/user/employees/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = self.client.get('/user/fetch-makers/')['ETag']
+        self.maker.deactivate()
+        self.assertEqual(self.client.get('/user/fetch-makers/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def list_etags(self, *users, url='/user/employees/'):
+        etags = []
+        for user in users:
+            self.login(user)
+            etags.append(self.client.get(url)['ETag'])
+        return etags
+
+    def assertListsChanged(self, users, etags, url='/user/employees/'):
+        for user, etag in zip(users, etags):
+            self.login(user)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200, user.email)
+
+    def test_review_keeping_the_status_changes_the_etags(self):
+        employee = self.create_employee(self.maker)
+        users = (self.maker, self.checker)
+        etags = self.list_etags(*users)
+
+        self.client.patch(f'/user/employees/{employee.id}/status/', {'status': 'pending'}, format='json')
+
+        self.assertListsChanged(users, etags)
+
+    def test_bulk_review_changes_the_etag_of_every_maker(self):
+        other_maker = Account.create_maker(email='other-maker@example.com', password='secret', created_by=self.checker)
+        ids = [
+            self.create_employee(self.maker).id,
+            self.create_employee(other_maker, status=CustomerStatus.APPROVED).id,
+        ]
+        users = (self.maker, other_maker, self.checker)
+        etags = self.list_etags(*users)
+
+        self.client.patch('/user/employees/status/', {'ids': ids, 'status': 'approved'}, format='json')
+
+        self.assertListsChanged(users, etags)
+
+    def test_moving_a_maker_changes_the_etags_of_both_checkers(self):
+        self.create_employee(self.maker)
+        other_checker = Account.create_checker(email='other@example.com', password='secret')
+        checkers = (self.checker, other_checker)
+        etags = self.list_etags(*checkers)
+        maker_etags = self.list_etags(*checkers, url='/user/fetch-makers/')
+
+        self.maker.created_by = other_checker
+        self.maker.save()
+
+        self.assertListsChanged(checkers, etags)
+        self.assertListsChanged(checkers, maker_etags, url='/user/fetch-makers/')
+
+    def test_moving_a_maker_moves_its_employees_counts(self):
+        other_maker = Account.create_maker(email='other-maker@example.com', password='secret', created_by=self.checker)
+        for maker in (self.maker, other_maker):
+            self.create_employee(maker)
+            EmployeeCounter.add(maker.id, self.checker.id, pending=1)
+        other_checker = Account.create_checker(email='other@example.com', password='secret')
+
+        self.maker.created_by = other_checker
+        self.maker.save()
+
+        for checker in (self.checker, other_checker):
+            self.login(checker)
+            counts = self.client.get('/user/employees/counts/').data
+            self.assertEqual(counts['pending'], 1)
+            self.assertEqual(len(self.client.get('/user/employees/').json()), 1)
+
+    def test_checker_email_change_changes_the_etags_of_reviewed_makers(self):
+        employee = self.create_employee(self.maker)
+        self.client.patch(f'/user/employees/{employee.id}/status/', {'status': 'approved'}, format='json')
+        etags = self.list_etags(self.maker)
+
+        self.checker.email = 'renamed-checker@example.com'
+        self.checker.save()
+
+        self.assertListsChanged([self.maker], etags)
+
+    def test_backfill_changes_the_etags_of_the_lists_it_fills(self):
+        self.create_employee(self.maker)
+        Employee.objects.update(unset__checker_id=True, unset__uploaded_by_email=True)
+        users = (self.maker, self.checker)
+        etags = self.list_etags(*users)
+
+        call_command('backfill_employee_owners', stdout=io.StringIO())
+
+        self.assertListsChanged(users, etags)
+        self.assertEqual(len(self.client.get('/user/employees/').json()), 1)
+
+
+class PrincipalCacheTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.checker = Account.create_checker(email='checker@example.com', password='secret')
+        self.login(self.checker)
+
+    def test_repeated_requests_skip_the_accounts_lookup(self):
+        self.client.get('/user/fetch-makers/')
+        with capture_commands() as queries:
+            response = self.client.get('/user/fetch-makers/')
+
+        self.assertEqual(response.status_code, 200)
+        # Only the list version and the makers query itself
+        self.assertEqual(queries.count, 2)
+        self.assertEqual(get_principal_cache().stats(), {'hits': 1, 'misses': 1})
+
+    def test_deactivating_an_account_invalidates_its_principal(self):
+        self.assertEqual(self.client.get('/user/fetch-makers/').status_code, 200)
+
+        self.checker.deactivate()
+
+        response = self.client.get('/user/fetch-makers/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['detail'], 'User account is disabled')
+
+    def test_saving_an_account_invalidates_its_principal(self):
+        self.client.get('/user/fetch-makers/')
+
+        self.checker.is_active = False
+        self.checker.save()
+
+        self.assertEqual(self.client.get('/user/fetch-makers/').status_code, 401)
+
+    def test_django_cache_backend_invalidates_every_token(self):
+        principal_cache = DjangoPrincipalCache(timeout=60)
+        principal_cache.clear()
+        principal_cache.set(self.checker.id, 'jti-1', {'email': 'a'})
+        principal_cache.set(self.checker.id, 'jti-2', {'email': 'a'})
+
+        principal_cache.invalidate(self.checker.id)
+
+        self.assertIsNone(principal_cache.get(self.checker.id, 'jti-1'))
+        self.assertIsNone(principal_cache.get(self.checker.id, 'jti-2'))
+
+    def test_django_cache_backend_clears_only_principals(self):
+        principal_cache = DjangoPrincipalCache(timeout=60)
+        principal_cache.set(self.checker.id, 'jti-1', {'email': 'a'})
+        caches['default'].set('unrelated', 'kept')
+
+        principal_cache.clear()
+
+        self.assertIsNone(principal_cache.get(self.checker.id, 'jti-1'))
+        self.assertEqual(caches['default'].get('unrelated'), 'kept')
+        principal_cache.set(self.checker.id, 'jti-1', {'email': 'b'})
+        self.assertEqual(principal_cache.get(self.checker.id, 'jti-1'), {'email': 'b'})
+
+
+class RegistrationTests(MongoTestCase):
+    def test_registration_is_a_single_insert(self):
+        with capture_commands() as queries:
+            response = self.client.post(
+                '/user/register/', {'email': 'Checker@Example.com', 'password': 'secret'}
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(queries.count, 1)
+        self.assertEqual(Account.objects.get().email, 'checker@example.com')
+
+    def test_duplicate_email_in_another_case_is_rejected(self):
+        Account.create_checker(email='checker@example.com', password='secret')
+        response = self.client.post(
+            '/user/register/', {'email': 'CHECKER@example.com', 'password': 'secret'}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['email'], ['Email already exists.'])
+        self.assertEqual(Account.objects.count(), 1)
+
+    def test_duplicate_maker_email_is_rejected(self):
+        checker = Account.create_checker(email='checker@example.com', password='secret')
+        self.login(checker)
+        response = self.client.post(
+            '/user/register/maker/', {'email': 'checker@example.com', 'password': 'secret'}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['email'], ['Email already exists.'])
+
+    def test_login_email_is_case_insensitive(self):
+        Account.create_checker(email='checker@example.com', password='secret')
+        response = self.client.post(
+            '/user/login/', {'email': 'Checker@Example.com', 'password': 'secret'}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_mixed_case_email_saved_before_normalisation_can_log_in(self):
+        checker = Account.create_checker(email='checker@example.com', password='secret')
+        Account.objects(id=checker.id).update_one(set__email='Checker@Example.com')
+
+        for email in ('Checker@Example.com', 'checker@example.com', 'CHECKER@EXAMPLE.COM'):
+            credentials = {'email': email, 'password': 'secret'}
+            self.assertEqual(self.client.post('/user/login/', credentials).status_code, 200, email)
+        call_command('normalize_account_emails', stdout=io.StringIO())
+        credentials['email'] = 'CHECKER@example.com'
+        self.assertEqual(self.client.post('/user/login/', credentials).status_code, 200)
+
+
+class MakerBulkRegisterViewTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.checker = Account.create_checker(email='checker@example.com', password='secret')
+        self.login(self.checker)
+
+    def test_makers_are_created_with_a_result_per_row(self):
+        Account.create_maker(email='taken@example.com', password='secret', created_by=self.checker)
+        response = self.client.post('/user/register/makers/', {'makers': [
+            {'email': 'One@example.com', 'password': 'secret'},
+            {'email': 'taken@example.com', 'password': 'secret'},
+            {'email': 'not-an-email', 'password': 'secret'},
+            {'email': 'one@example.com', 'password': 'secret'},
+            {'email': 'two@example.com', 'password': 'secret'},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([bool(result['id']) for result in response.data['results']],
+                         [True, False, False, False, True])
+        self.assertEqual(response.data['results'][1]['errors'], ['email: Email already exists.'])
+
+        maker = Account.objects.get(email='one@example.com')
+        self.assertTrue(maker.is_maker)
+        self.assertEqual(maker.created_by_id, self.checker.id)
+        self.assertTrue(maker.check_password('secret'))
+
+    def test_makers_can_be_uploaded_as_csv(self):
+        manifest = SimpleUploadedFile(
+            'makers.csv', b'email,password\r\none@example.com,secret\r\ntwo@example.com,secret\r\n'
+        )
+        response = self.client.post('/user/register/makers/', {'file': manifest}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(Account.objects(created_by=self.checker.id).count(), 2)
+
+    def test_makers_cannot_provision_makers(self):
+        maker = Account.create_maker(email='maker@example.com', password='secret', created_by=self.checker)
+        self.login(maker)
+        response = self.client.post('/user/register/makers/', {'makers': []}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class MongoConnectionTests(MongoTestCase):
+    def test_ready_when_mongodb_answers(self):
+        response = self.client.get('/ready/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'ready')
+
+    def test_not_ready_when_the_ping_fails(self):
+        with mock.patch('users_admins_app.views.ping_mongodb', side_effect=TimeoutError):
+            response = self.client.get('/ready/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.data['error'], 'TimeoutError')
+
+    def test_pool_listener_counts_connections(self):
+        listener = PoolStatsListener()
+        address = ('db.example.com', 27017)
+        listener.pool_created(monitoring.PoolCreatedEvent(address, {}))
+        listener.connection_created(monitoring.ConnectionCreatedEvent(address, 1))
+        listener.connection_checked_out(monitoring.ConnectionCheckedOutEvent(address, 1))
+        listener.connection_checked_in(monitoring.ConnectionCheckedInEvent(address, 1))
+        listener.connection_checked_out(monitoring.ConnectionCheckedOutEvent(address, 1))
+
+        self.assertEqual(listener.stats(), {'db.example.com:27017': {
+            'open': 1, 'checked_out': 1, 'created': 1, 'closed': 0, 'checkouts': 2, 'checkout_failures': 0,
+        }})
+
+
+class AuthenticationTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.checker = Account.create_checker(email='checker@example.com', password='secret')
+        self.tokens = get_tokens_for_user(self.checker)
+
+    def test_bearer_header_is_accepted(self):
+        response = self.client.get(
+            '/user/fetch-makers/', HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}"
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_refresh_token_is_not_an_access_token(self):
+        self.client.cookies['access_token'] = self.tokens['refresh']
+        response = self.client.get('/user/fetch-makers/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_missing_token_is_rejected(self):
+        response = self.client.get('/user/fetch-makers/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['detail'], 'No authentication token provided')
+
+    def test_login_does_not_require_a_token(self):
+        self.client.cookies['access_token'] = 'expired-or-garbage'
+        response = self.client.post(
+            '/user/login/', {'email': 'checker@example.com', 'password': 'secret'}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(LAST_LOGIN_GRANULARITY=60)
+    def test_login_only_sets_a_stale_last_login(self):
+        credentials = {'email': 'checker@example.com', 'password': 'secret'}
+        Account.objects(id=self.checker.id).update_one(
+            set__last_login=timezone.now() - timedelta(hours=1)
+        )
+        self.client.post('/user/login/', credentials)
+        first_login = Account.objects.get(id=self.checker.id).last_login
+        self.assertGreater(first_login, (timezone.now() - timedelta(minutes=1)).replace(tzinfo=None))
+
+        with capture_commands() as queries:
+            response = self.client.post('/user/login/', credentials)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Account.objects.get(id=self.checker.id).last_login, first_login)
+        # Only the account lookup, no write
+        self.assertEqual(queries.count, 1)
+
+
+class UploadTestCase(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.upload_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.upload_dir.cleanup)
+        self.checker = Account.create_checker(email='checker@example.com', password='secret')
+        self.maker = Account.create_maker(email='maker@example.com', password='secret', created_by=self.checker)
+        self.login(self.maker)
+
+    def upload_settings(self, **extra):
+        """Store uploads with the local stub instead of Cloudinary."""
+        return override_settings(EMPLOYEE_UPLOADS={
+            'BACKEND': 'users_admins_app.uploads.LocalStubUploader',
+            'OPTIONS': {'location': self.upload_dir.name, 'base_url': 'https://files.test'},
+            **extra
+        })
+
+
+class EmployeeUploadViewTests(UploadTestCase):
+    def upload(self):
+        return self.client.post('/user/employees/upload/', {
+            'first_name': 'Jane',
+            'last_name': 'Doe',
+            'photo': SimpleUploadedFile('photo.jpg', b'photo-bytes', content_type='image/jpeg'),
+            'resume': SimpleUploadedFile('resume.pdf', b'resume-bytes', content_type='application/pdf'),
+        }, format='multipart')
+
+    def test_upload_stores_both_files(self):
+        with self.upload_settings():
+            response = self.upload()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['upload_state'], 'complete')
+        self.assertTrue(response.data['photo_url'].startswith('https://files.test/employees/photos/'))
+        self.assertTrue(response.data['resume_url'].startswith('https://files.test/employees/resumes/'))
+        employee = Employee.objects.get(id=response.data['id'])
+        with open(f'{self.upload_dir.name}/{employee.resume_public_id}', 'rb') as resume:
+            self.assertEqual(resume.read(), b'resume-bytes')
+
+    def test_oversized_file_is_rejected_while_parsing(self):
+        with self.upload_settings(MAX_FILE_SIZES={'photo': 4}):
+            response = self.upload()
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('photo', response.data)
+        self.assertEqual(Employee.objects.count(), 0)
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=0)
+    def test_spooled_files_are_uploaded_from_disk(self):
+        with self.upload_settings():
+            response = self.upload()
+
+        self.assertEqual(response.status_code, 201)
+        employee = Employee.objects.get(id=response.data['id'])
+        with open(f'{self.upload_dir.name}/{employee.photo_public_id}', 'rb') as photo:
+            self.assertEqual(photo.read(), b'photo-bytes')
+
+    def test_deferred_upload_fills_in_urls_in_the_background(self):
+        with self.upload_settings(DEFERRED=True):
+            response = self.upload()
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.data['upload_state'], 'pending')
+            self.assertIsNone(response.data['photo_url'])
+            wait_for_pending_uploads(timeout=10)
+
+        employee = Employee.objects.get(id=response.data['id'])
+        self.assertEqual(employee.upload_state, UploadState.COMPLETE)
+        self.assertTrue(employee.photo_url.startswith('https://files.test/employees/photos/'))
+        self.assertTrue(employee.resume_url.startswith('https://files.test/employees/resumes/'))
+
+
+class EmployeeImportViewTests(UploadTestCase):
+    def import_employees(self, manifest, files):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            for name, content in files.items():
+                zf.writestr(name, content)
+        with self.upload_settings(IMPORT_BATCH_SIZE=2):
+            response = self.client.post('/user/employees/import/', {
+                'manifest': SimpleUploadedFile('manifest.csv', manifest.encode(), content_type='text/csv'),
+                'archive': SimpleUploadedFile('files.zip', archive.getvalue(), content_type='application/zip'),
+            }, format='multipart')
+            self.assertEqual(response.status_code, 202, response.data)
+            wait_for_pending_uploads(timeout=10)
+        return self.client.get(f"/user/employees/import/{response.data['id']}/")
+
+    def test_import_creates_valid_rows_and_reports_the_rest(self):
+        manifest = (
+            'first_name,last_name,photo,resume\n'
+            'Ann,One,ann.jpg,ann.pdf\n'
+            'Bob,Two,bob.jpg,missing.pdf\n'
+            ',Three,ann.jpg,ann.pdf\n'
+            'Cid,Four,cid.jpg,cid.pdf\n'
+        )
+        files = {'ann.jpg': b'a', 'ann.pdf': b'a', 'bob.jpg': b'b', 'cid.jpg': b'c', 'cid.pdf': b'c'}
+
+        response = self.import_employees(manifest, files)
+
+        self.assertEqual(response.status_code, 200)
+        job = response.data
+        self.assertEqual(job['state'], 'complete')
+        self.assertEqual((job['total_rows'], job['created_count'], job['failed_count']), (4, 2, 2))
+        results = {result['row']: result for result in job['results']}
+        self.assertIn('resume: "missing.pdf" is not in the archive.', results[2]['errors'])
+        self.assertTrue(results[3]['errors'][0].startswith('first_name'))
+        self.assertEqual(
+            sorted(Employee.objects.scalar('first_name')), ['Ann', 'Cid']
+        )
+        self.assertEqual(
+            Employee.objects.get(id=results[4]['employee_id']).uploaded_by.id, self.maker.id
+        )
+
+    def test_manifest_without_required_columns_fails_the_job(self):
+        with self.assertLogs('users_admins_app.bulk_import', 'ERROR'):
+            response = self.import_employees('name,photo\nAnn,ann.jpg\n', {'ann.jpg': b'a'})
+
+        self.assertEqual(response.data['state'], 'failed')
+        self.assertIn('last_name', response.data['error'])
+
+
+class EmployeeCountsViewTests(UploadTestCase):
+    def counts(self, user):
+        self.login(user)
+        return self.client.get('/user/employees/counts/').data
+
+    def test_counters_follow_uploads_and_reviews(self):
+        with self.upload_settings():
+            for _ in range(3):
+                self.client.post('/user/employees/upload/', {
+                    'first_name': 'Jane',
+                    'last_name': 'Doe',
+                    'photo': SimpleUploadedFile('photo.jpg', b'photo-bytes'),
+                    'resume': SimpleUploadedFile('resume.pdf', b'resume-bytes'),
+                }, format='multipart')
+        first, second, third = Employee.objects.scalar('id')
+
+        self.login(self.checker)
+        self.client.patch(f'/user/employees/{first}/status/', {'status': 'declined'}, format='json')
+        self.client.patch('/user/employees/status/', {'ids': [first, second], 'status': 'approved'}, format='json')
+
+        expected = {'pending': 1, 'approved': 2, 'declined': 0, 'total': 3}
+        self.assertEqual(self.counts(self.maker), expected)
+        self.assertEqual(self.counts(self.checker), expected)
+
+    def test_reconcile_rebuilds_drifted_counters(self):
+        self.create_employee(self.maker)
+        self.create_employee(self.maker, status=CustomerStatus.APPROVED)
+        EmployeeCounter(id=self.maker.id, pending=7).save()
+
+        call_command('reconcile_employee_counters', stdout=io.StringIO())
+
+        expected = {'pending': 1, 'approved': 1, 'declined': 0, 'total': 2}
+        self.assertEqual(self.counts(self.maker), expected)
+        self.assertEqual(self.counts(self.checker), expected)
+
+
+class EmployeeBulkStatusUpdateViewTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.checker = Account.create_checker(email='checker@example.com', password='secret')
+        self.maker = Account.create_maker(email='maker@example.com', password='secret', created_by=self.checker)
+        other_checker = Account.create_checker(email='other@example.com', password='secret')
+        self.other_maker = Account.create_maker(email='other-maker@example.com', password='secret', created_by=other_checker)
+        self.login(self.checker)
+
+    def test_updates_authorized_employees_and_reports_the_rest(self):
+        mine = [self.create_employee(self.maker) for _ in range(3)]
+        foreign = self.create_employee(self.other_maker)
+        ids = [e.id for e in mine] + [foreign.id, 'does-not-exist']
+
+        with capture_commands() as queries:
+            response = self.client.patch(
+                '/user/employees/status/', {'ids': ids, 'status': 'approved'}, format='json'
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 3)
+        self.assertEqual(
+            [r['outcome'] for r in response.data['results']],
+            ['updated', 'updated', 'updated', 'forbidden', 'not_found']
+        )
+        # auth, makers, grouped authorized ids, update_many per group, counters, existence check
+        self.assertLessEqual(queries.count, 6)
+        for employee in mine:
+            employee.reload()
+            self.assertEqual(employee.status, CustomerStatus.APPROVED)
+            self.assertEqual(employee.checked_by.id, self.checker.id)
+        foreign.reload()
+        self.assertEqual(foreign.status, CustomerStatus.PENDING)
+
+    def test_review_between_read_and_update_keeps_counters_exact(self):
+        first, second = [self.create_employee(self.maker) for _ in range(2)]
+        EmployeeCounter.add(self.maker.id, self.checker.id, pending=2)
+        aggregate = QuerySet.aggregate
+
+        def review_in_between(queryset, *args, **kwargs):
+            groups = aggregate(queryset, *args, **kwargs)
+            if not first.reload().status == CustomerStatus.DECLINED:
+                first.transition_status(CustomerStatus.DECLINED, self.checker)
+                EmployeeCounter.add(self.maker.id, self.checker.id, pending=-1, declined=1)
+            return groups
+
+        with mock.patch.object(QuerySet, 'aggregate', autospec=True, side_effect=review_in_between):
+            response = self.client.patch(
+                '/user/employees/status/', {'ids': [first.id, second.id], 'status': 'approved'}, format='json'
+            )
+
+        self.assertEqual(response.data['updated'], 2)
+        expected = {'pending': 0, 'approved': 2, 'declined': 0, 'total': 2}
+        for account in (self.maker, self.checker):
+            self.assertEqual(EmployeeCounter.objects.get(id=account.id).as_dict(), expected)
+
+    def test_reviews_employees_saved_before_checker_id(self):
+        mine = self.create_employee(self.maker)
+        foreign = self.create_employee(self.other_maker)
+        Employee.objects.update(unset__checker_id=True)
+
+        response = self.client.patch(
+            '/user/employees/status/', {'ids': [mine.id, foreign.id], 'status': 'approved'}, format='json'
+        )
+
+        self.assertEqual([r['outcome'] for r in response.data['results']], ['updated', 'forbidden'])
+        mine.reload()
+        self.assertEqual(mine.status, CustomerStatus.APPROVED)
+        self.assertEqual(mine.checker_id, self.checker.id)
+
+    def test_makers_cannot_bulk_update(self):
+        self.login(self.maker)
+        employee = self.create_employee(self.maker)
+        response = self.client.patch(
+            '/user/employees/status/', {'ids': [employee.id], 'status': 'approved'}, format='json'
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+class EmployeeStatusUpdateViewTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.checker = Account.create_checker(email='checker@example.com', password='secret')
+        self.maker = Account.create_maker(email='maker@example.com', password='secret', created_by=self.checker)
+        self.employee = self.create_employee(self.maker)
+        self.login(self.checker)
+
+    def update_status(self, employee_id, status):
+        return self.client.patch(
+            f'/user/employees/{employee_id}/status/', {'status': status}, format='json'
+        )
+
+    def test_checker_reviews_employee_of_their_maker(self):
+        self.update_status(self.employee.id, 'declined')  # warm the principal cache
+
+        with capture_commands() as queries:
+            response = self.update_status(self.employee.id, 'approved')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['checked_by_email'], 'checker@example.com')
+        self.employee.reload()
+        self.assertEqual(self.employee.status, CustomerStatus.APPROVED)
+        # fetch, conditional update and the counters
+        self.assertLessEqual(queries.count, 4)
+
+    def test_other_checker_is_forbidden_and_missing_is_not_found(self):
+        other = Account.create_checker(email='other@example.com', password='secret')
+        self.login(other)
+
+        self.assertEqual(self.update_status(self.employee.id, 'approved').status_code, 403)
+        self.assertEqual(self.update_status('does-not-exist', 'approved').status_code, 404)
+        self.employee.reload()
+        self.assertEqual(self.employee.status, CustomerStatus.PENDING)
+
+    def test_reviews_employee_saved_before_checker_id(self):
+        Employee.objects.update(unset__checker_id=True)
+        other = Account.create_checker(email='other@example.com', password='secret')
+        self.login(other)
+        self.assertEqual(self.update_status(self.employee.id, 'approved').status_code, 403)
+
+        self.login(self.checker)
+        self.assertEqual(self.update_status(self.employee.id, 'approved').status_code, 200)
+        self.employee.reload()
+        self.assertEqual(self.employee.status, CustomerStatus.APPROVED)
+        self.assertEqual(self.employee.checker_id, self.checker.id)
+
+    def test_concurrent_review_is_a_conflict(self):
+        stale = Employee.objects.get(id=self.employee.id)
+        Employee.objects(id=self.employee.id).update_one(set__status=CustomerStatus.DECLINED)
+
+        request = mock.Mock(user=self.checker)
+        serializer = EmployeeUpdateSerializer(
+            stale, data={'status': 'approved'}, partial=True, context={'request': request}
+        )
+        self.assertTrue(serializer.is_valid())
+        with self.assertRaises(ReviewConflict):
+            serializer.save()
+        self.employee.reload()
+        self.assertEqual(self.employee.status, CustomerStatus.DECLINED)
+
+    def test_transition_sets_only_the_changed_fields(self):
+        self.update_status(self.employee.id, 'approved')
+        approved = Employee.objects.get(id=self.employee.id)
+
+        with capture_commands() as queries:
+            declined = approved.transition_status(CustomerStatus.DECLINED, self.checker)
+
+        self.assertEqual(queries.count, 1)
+        update = queries.commands[0].split("'$set'")[1]
+        self.assertIn("'status': 'declined'", update)
+        self.assertNotIn('checked_by', update)
+        self.assertEqual(declined.status, CustomerStatus.DECLINED)
+        self.assertEqual(declined.checked_by_id, self.checker.id)
+        self.assertGreaterEqual(declined.updated_at, approved.updated_at)
+        # The instance still holds approved, it is now stale
+        self.assertIsNone(approved.transition_status(CustomerStatus.PENDING, self.checker))
+
+    def test_backfill_sets_owner_fields_of_existing_employees(self):
+        self.update_status(self.employee.id, 'approved')
+        Employee.objects.update(
+            unset__checker_id=True,
+            unset__uploaded_by_email=True,
+            unset__checked_by_email=True
+        )
+
+        call_command('backfill_employee_owners', stdout=io.StringIO())
+
+        self.employee.reload()
+        self.assertEqual(self.employee.checker_id, self.checker.id)
+        self.assertEqual(self.employee.uploaded_by_email, 'maker@example.com')
+        self.assertEqual(self.employee.checked_by_email, 'checker@example.com')
+
+    def test_email_changes_are_copied_to_employees(self):
+        self.update_status(self.employee.id, 'approved')
+
+        self.maker.email = 'renamed-maker@example.com'
+        self.maker.save()
+        self.checker.email = 'renamed-checker@example.com'
+        self.checker.save()
+
+        self.employee.reload()
+        self.assertEqual(self.employee.uploaded_by_email, 'renamed-maker@example.com')
+        self.assertEqual(self.employee.checked_by_email, 'renamed-checker@example.com')
+
+
+class PasswordRehashTests(MongoTestCase):
+    @override_settings(
+        PASSWORD_HASHERS=['users_admins_app.hashers.PBKDF2PasswordHasher'],
+        PASSWORD_HASHING={'PBKDF2_ITERATIONS': 1000}
+    )
+    def test_login_rehashes_outdated_parameters(self):
+        user = Account.create_checker(email='checker@example.com', password='secret')
+        self.assertIn('$1000$', user.password)
+
+        with self.settings(PASSWORD_HASHING={'PBKDF2_ITERATIONS': 2000}):
+            response = self.client.post(
+                '/user/login/', {'email': 'checker@example.com', 'password': 'secret'}
+            )
+
+        self.assertEqual(response.status_code, 200)
+        user.reload()
+        self.assertIn('$2000$', user.password)
+        self.assertTrue(user.check_password('secret'))
+
+    def test_login_rehashes_with_the_preferred_hasher(self):
+        user = Account.create_checker(email='checker@example.com', password='secret')
+        self.assertTrue(user.password.startswith('md5$'))
+
+        with self.settings(PASSWORD_HASHERS=[
+            'users_admins_app.hashers.ScryptPasswordHasher',
+            'django.contrib.auth.hashers.MD5PasswordHasher',
+        ]):
+            response = self.client.post(
+                '/user/login/', {'email': 'checker@example.com', 'password': 'secret'}
+            )
+
+        self.assertEqual(response.status_code, 200)
+        user.reload()
+        self.assertTrue(user.password.startswith('scrypt$'))
+
+
+# Where urls.py mounts the async views when settings.ASYNC_VIEWS is on, for
+# AsyncViewTests
+urlpatterns = [
+    path('user/login/', AsyncLoginView.as_view()),
+    path('user/employees/upload/', AsyncEmployeeUploadView.as_view()),
+    path('user/employees/', AsyncEmployeeListView.as_view()),
+    path('user/employees/<str:employee_id>/status/', AsyncEmployeeStatusUpdateView.as_view()),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncViewTests(UploadTestCase):
+    """The async views answer like the APIViews they stand in for."""
+
+    def setUp(self):
+        super().setUp()
+        self.async_client = AsyncClient()
+
+    def async_login(self, user):
+        self.async_client.cookies['access_token'] = get_tokens_for_user(user)['access']
+
+    async def sync_response(self, method, *args, **kwargs):
+        with override_settings(ROOT_URLCONF='Backend.urls'):
+            return await sync_to_async(getattr(self.client, method))(*args, **kwargs)
+
+    async def test_login_answers_like_the_sync_view(self):
+        for password in ('secret', 'wrong'):
+            credentials = {'email': 'Checker@Example.com', 'password': password}
+            expected = await self.sync_response('post', '/user/login/', credentials, format='json')
+            response = await self.async_client.post('/user/login/', credentials, content_type='application/json')
+
+            self.assertEqual(response.status_code, expected.status_code)
+            if password == 'secret':
+                self.assertEqual(response.json()['user'], expected.json()['user'])
+                self.assertIn('access_token', response.cookies)
+            else:
+                self.assertEqual(response.json(), expected.json())
+
+    async def test_list_renders_like_the_sync_view(self):
+        for number in range(3):
+            await sync_to_async(self.create_employee)(self.maker, first_name=f'Jane{number}')
+        self.login(self.checker)
+        self.async_login(self.checker)
+        expected = await self.sync_response('get', '/user/employees/?limit=2')
+
+        response = await self.async_client.get('/user/employees/?limit=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, expected.content)
+
+        response = await self.async_client.get('/user/employees/', **{'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_missing_token_is_refused_with_a_bearer_challenge(self):
+        response = await self.async_client.get('/user/employees/')
+
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+        self.assertEqual(response.json(), {'detail': 'No authentication token provided'})
+
+    async def test_review_of_employee_saved_before_checker_id(self):
+        employee = await sync_to_async(self.create_employee)(self.maker)
+        await sync_to_async(Employee.objects.update)(unset__checker_id=True)
+        self.async_login(self.checker)
+
+        response = await self.async_client.patch(
+            f'/user/employees/{employee.id}/status/', {'status': 'approved'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        await sync_to_async(employee.reload)()
+        self.assertEqual(employee.checker_id, self.checker.id)
+
+    async def test_upload_and_review(self):
+        request = AsyncRequestFactory().post('/user/employees/upload/', {
+            'first_name': 'Jane',
+            'last_name': 'Doe',
+            'photo': SimpleUploadedFile('photo.jpg', b'photo-bytes', content_type='image/jpeg'),
+            'resume': SimpleUploadedFile('resume.pdf', b'resume-bytes', content_type='application/pdf'),
+        }, Authorization=f"Bearer {get_tokens_for_user(self.maker)['access']}")
+        # The test client's payload cannot be read past its end the way
+        # the multipart parser reads an ASGI body, buffer it
+        request.body
+        with self.upload_settings():
+            response = await AsyncEmployeeUploadView.as_view()(request)
+        self.assertEqual(response.status_code, 201)
+        employee_id = json.loads(response.content)['id']
+
+        self.async_login(self.checker)
+        self.assertEqual((await self.async_client.post('/user/employees/upload/')).status_code, 403)
+
+        response = await self.async_client.patch(
+            f'/user/employees/{employee_id}/status/', {'status': 'approved'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['checked_by_email'], 'checker@example.com')
+        counts = await sync_to_async(lambda: EmployeeCounter.objects.get(id=self.checker.id).as_dict())()
+        self.assertEqual(counts, {'pending': 0, 'approved': 1, 'declined': 0, 'total': 1})
+
+    async def test_review_accepts_form_and_multipart_bodies(self):
+        employee = await sync_to_async(self.create_employee)(self.maker)
+        token = f"Bearer {get_tokens_for_user(self.checker)['access']}"
+        bodies = [
+            ('declined', 'application/x-www-form-urlencoded', b'status=declined'),
+            ('approved', MULTIPART_CONTENT, encode_multipart(BOUNDARY, {'status': 'approved'})),
+        ]
+        for status, content_type, body in bodies:
+            request = AsyncRequestFactory().patch(
+                f'/user/employees/{employee.id}/status/', body, content_type=content_type, Authorization=token
+            )
+            request.body
+            response = await AsyncEmployeeStatusUpdateView.as_view()(request, employee_id=employee.id)
+            self.assertEqual(response.status_code, 200)
+            await sync_to_async(employee.reload)()
+            self.assertEqual(employee.status.value, status)
+
+        request = AsyncRequestFactory().patch(
+            f'/user/employees/{employee.id}/status/', b'status=pending', content_type='text/plain', Authorization=token
+        )
+        response = await AsyncEmployeeStatusUpdateView.as_view()(request, employee_id=employee.id)
+        self.assertEqual(response.status_code, 415)
+
+
+class StreamingASGIHandlerTests(SimpleTestCase):
+    async def test_streamed_parts_are_pulled_off_the_event_loop(self):
+        threads = set()
+
+        def lines():
+            for number in range(3):
+                threads.add(threading.get_ident())
+                yield f'{number}\n'
+
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        await StreamingASGIHandler().send_response(StreamingHttpResponse(lines()), send)
+
+        self.assertNotIn(threading.get_ident(), threads)
+        self.assertEqual(messages[0]['status'], 200)
+        self.assertEqual(b''.join(message.get('body', b'') for message in messages[1:]), b'0\n1\n2\n')
+        self.assertFalse(messages[-1].get('more_body'))
+
+
+class CloudinaryAsyncUploadTests(SimpleTestCase):
+    async def test_big_files_are_sent_in_signed_chunks(self):
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200, json={'public_id': 'employees/resumes/abc', 'secure_url': 'https://res.test/abc'})
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        uploader = CloudinaryUploader(chunk_size=4)
+        with mock.patch('users_admins_app.uploads._http_client', return_value=client):
+            result = await uploader.aupload(
+                SimpleUploadedFile('resume.pdf', b'0123456789'),
+                folder='employees/resumes', resource_type='raw',
+                cloud_name='demo', api_key='key', api_secret='secret'
+            )
+
+        self.assertEqual(result['secure_url'], 'https://res.test/abc')
+        self.assertEqual(
+            [request.headers['Content-Range'] for request in requests],
+            ['bytes 0-3/10', 'bytes 4-7/10', 'bytes 8-9/10']
+        )
+        self.assertEqual(len({request.headers['X-Unique-Upload-Id'] for request in requests}), 1)
+        self.assertEqual(str(requests[0].url), 'https://api.cloudinary.com/v1_1/demo/raw/upload')
+        self.assertIn(b'name="signature"', requests[0].content)
+        self.assertIn(b'employees/resumes/abc', requests[1].content)
+
+
+class InstrumentationTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.clear()
+        self.checker = Account.create_checker(email='checker@example.com', password='secret')
+        self.login(self.checker)
+
+    def test_disabled_by_default(self):
+        response = self.client.get('/user/employees/')
+
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(self.client.get('/metrics/').status_code, 404)
+
+    @override_settings(INSTRUMENTATION={'ENABLED': True})
+    def test_requests_are_timed_per_route(self):
+        response = self.client.get('/user/employees/')
+
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+, .*serialize;dur=[\d.]+')
+        exposition = self.client.get('/metrics/').content.decode()
+        self.assertIn(
+            'checkmate_request_duration_seconds_count{route="user/employees/",method="GET",status="200"} 1',
+            exposition
+        )
+        self.assertIn('checkmate_request_work_seconds_count{route="user/employees/",method="GET",work="serialize"} 1', exposition)
+        self.assertIn('checkmate_principal_cache_misses 1', exposition)
+        self.assertIn('checkmate_principal_cache_hits 0', exposition)
+
+    async def test_mongo_commands_on_the_mongodb_pool_count_for_the_request(self):
+        event = mock.Mock(duration_micros=2500)
+        with collect_timings() as timings:
+            await run_mongo(mongo_command_timer.succeeded, event)
+            await run_mongo(mongo_command_timer.failed, event)
+
+        self.assertEqual(timings.mongo_commands, 2)
+        self.assertAlmostEqual(timings.durations['mongo'], 0.005)
+
+
+class QueryBudgetTests(UploadTestCase):
+    """MongoDB commands per request of every endpoint, with employees of two
+    makers behind them so a query per row goes over budget."""
+
+    def setUp(self):
+        super().setUp()
+        other_maker = Account.create_maker(email='other-maker@example.com', password='secret', created_by=self.checker)
+        self.employees = [self.create_employee(maker) for maker in (self.maker, other_maker) for _ in range(3)]
+
+    def request(self, budget, method, path, data=None, **extra):
+        # Budgets include the principal lookup of a cold cache
+        get_principal_cache().clear()
+        with max_commands(budget, allow_repeats=False):
+            response = getattr(self.client, method)(path, data, **extra)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 300)
+        return response
+
+    def test_register(self):
+        self.client.cookies.clear()
+        self.request(1, 'post', '/user/register/', {'email': 'new@example.com', 'password': 'secret'})
+
+    def test_register_maker(self):
+        self.login(self.checker)
+        self.request(3, 'post', '/user/register/maker/', {'email': 'new@example.com', 'password': 'secret'})
+
+    def test_register_makers(self):
+        self.login(self.checker)
+        makers = [{'email': f'new{number}@example.com', 'password': 'secret'} for number in range(3)]
+        self.request(3, 'post', '/user/register/makers/', {'makers': makers}, format='json')
+
+    def test_fetch_makers(self):
+        self.login(self.checker)
+        self.request(3, 'get', '/user/fetch-makers/')
+
+    def test_login(self):
+        self.request(1, 'post', '/user/login/', {'email': 'maker@example.com', 'password': 'secret'})
+
+    def test_refresh_token(self):
+        self.client.cookies['refresh_token'] = get_tokens_for_user(self.maker)['refresh']
+        self.request(0, 'post', '/user/refresh-token/')
+
+    def test_upload(self):
+        with self.upload_settings():
+            self.request(4, 'post', '/user/employees/upload/', {
+                'first_name': 'Jane',
+                'last_name': 'Doe',
+                'photo': SimpleUploadedFile('photo.jpg', b'photo-bytes'),
+                'resume': SimpleUploadedFile('resume.pdf', b'resume-bytes'),
+            }, format='multipart')
+
+    def test_import(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('ann.jpg', b'a')
+            zf.writestr('ann.pdf', b'a')
+        with self.upload_settings():
+            response = self.request(3, 'post', '/user/employees/import/', {
+                'manifest': SimpleUploadedFile('manifest.csv', b'first_name,last_name,photo,resume\nAnn,One,ann.jpg,ann.pdf\n'),
+                'archive': SimpleUploadedFile('files.zip', archive.getvalue()),
+            }, format='multipart')
+            wait_for_pending_uploads(timeout=10)
+        self.request(2, 'get', f"/user/employees/import/{response.data['id']}/")
+
+    def test_list(self):
+        for user in (self.checker, self.maker):
+            self.login(user)
+            self.request(3, 'get', '/user/employees/')
+            self.request(3, 'get', '/user/employees/', {'limit': 2})
+
+    def test_export(self):
+        self.login(self.checker)
+        self.request(2, 'get', '/user/employees/export/')
+
+    def test_counts(self):
+        self.request(2, 'get', '/user/employees/counts/')
+
+    def test_bulk_status(self):
+        self.login(self.checker)
+        ids = [employee.id for employee in self.employees]
+        # One guarded update per maker and previous status
+        self.request(6, 'patch', '/user/employees/status/', {'ids': ids, 'status': 'approved'}, format='json')
+
+    def test_status(self):
+        self.login(self.checker)
+        self.request(4, 'patch', f'/user/employees/{self.employees[0].id}/status/', {'status': 'approved'}, format='json')
+
+    def test_logout_ready_and_metrics(self):
+        for method, url_path in (('post', '/user/logout/'), ('get', '/ready/'), ('get', '/metrics/')):
+            with max_commands(0):
+                getattr(self.client, method)(url_path)
+
+    def test_repeated_commands_fail(self):
+        with self.assertRaisesRegex(AssertionError, 'more than once'):
+            with max_commands(5, allow_repeats=False):
+                for _ in range(2):
+                    Account.objects(id=self.maker.id).first()
+
+    def test_middleware_warns_over_budget_and_about_repeats(self):
+        self.assertRaises(MiddlewareNotUsed, QueryBudgetMiddleware, lambda request: None)
+
+        def view(request):
+            for _ in range(2):
+                Account.objects(id=self.maker.id).first()
+            return HttpResponse()
+
+        with self.settings(QUERY_BUDGET={'ENABLED': True, 'MAX_COMMANDS': 1}):
+            middleware = QueryBudgetMiddleware(view)
+        with self.assertLogs('users_admins_app.query_budget', 'WARNING') as logs:
+            middleware(RequestFactory().get('/user/employees/'))
+
+        self.assertIn('GET /user/employees/ sent 2 MongoDB commands, over the budget of 1', logs.output[0])
+        self.assertIn('sent the same MongoDB command 2 times: find accounts', logs.output[1])
@@ -0,0 +1,356 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+import weakref
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import lru_cache
+from pathlib import Path
+
+import cloudinary
+import cloudinary.exceptions
+import cloudinary.uploader
+import cloudinary.utils
+import httpx
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler
+from django.core.signals import setting_changed
+from django.template.defaultfilters import filesizeformat
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import ValidationError
+
+from .instrumentation import timing
+
+logger = logging.getLogger(__name__)
+
+PHOTO_OPTIONS = {
+    'folder': 'employees/photos',
+    'resource_type': 'image',
+}
+RESUME_OPTIONS = {
+    'folder': 'employees/resumes',
+    'resource_type': 'raw',
+    'type': 'upload',
+    'access_type': 'public',  # Use access_type instead of access_mode
+}
+
+DEFAULTS = {
+    'BACKEND': 'users_admins_app.uploads.CloudinaryUploader',
+    'OPTIONS': {},
+    'DEFERRED': False,
+    'MAX_WORKERS': 8,
+    # Per form field, fields that are not listed are not limited
+    'MAX_FILE_SIZES': {},
+    # Bulk imports, see bulk_import.py
+    'IMPORT_CONCURRENCY': 4,
+    'IMPORT_BATCH_SIZE': 100,
+}
+
+
+class CloudinaryUploader:
+    """Uploads to Cloudinary, streaming big files in chunks.
+
+    Files bigger than chunk_size go through upload_large, which reads and
+    sends one chunk at a time, so no upload is ever fully held in memory.
+    Cloudinary requires chunks of at least 5MB.
+    """
+
+    def __init__(self, chunk_size=6 * 1024 * 1024):
+        self.chunk_size = chunk_size
+
+    def upload(self, file, **options):
+        # Files Django spooled to disk are handed over by path
+        if hasattr(file, 'temporary_file_path'):
+            file = file.temporary_file_path()
+
+        if isinstance(file, (str, os.PathLike)):
+            size = os.path.getsize(file)
+        else:
+            size = file.size
+
+        if size > self.chunk_size:
+            return cloudinary.uploader.upload_large(file, chunk_size=self.chunk_size, **options)
+        return cloudinary.uploader.upload(file, **options)
+
+    async def aupload(self, file, **options):
+        """upload for async views, sent with httpx on the running event loop.
+
+        The requests are built and signed like those of upload and
+        upload_large, big files go one chunk at a time the same way.
+        """
+        if hasattr(file, 'temporary_file_path'):
+            file = file.temporary_file_path()
+
+        if isinstance(file, (str, os.PathLike)):
+            file_io = open(file, 'rb')
+            name = os.path.basename(file)
+            size = os.path.getsize(file)
+        else:
+            file_io = file
+            name = file.name or 'stream'
+            size = file.size
+
+        loop = asyncio.get_running_loop()
+        upload_id = cloudinary.utils.random_public_id()
+        position = 0
+        result = None
+        try:
+            while result is None or position < size:
+                # Disk reads stay off the event loop
+                chunk = await loop.run_in_executor(None, file_io.read, self.chunk_size)
+                headers = {}
+                if size > self.chunk_size:
+                    headers = {
+                        'Content-Range': f'bytes {position}-{position + len(chunk) - 1}/{size}',
+                        'X-Unique-Upload-Id': upload_id,
+                    }
+                result = await _cloudinary_upload((name, chunk), headers, options)
+                position += len(chunk)
+                options['public_id'] = result.get('public_id')
+                if not chunk:
+                    break
+        finally:
+            if file_io is not file:
+                file_io.close()
+        return result
+
+
+_http_clients = weakref.WeakKeyDictionary()
+
+
+def _http_client():
+    # httpx clients are bound to the event loop they were first used on
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None:
+        client = _http_clients[loop] = httpx.AsyncClient(timeout=60)
+    return client
+
+
+async def _cloudinary_upload(file, headers, options):
+    """One signed call of Cloudinary's upload API, see cloudinary.uploader.call_api."""
+    params = cloudinary.utils.sign_request(
+        cloudinary.utils.cleanup_params(cloudinary.utils.build_upload_params(**options)),
+        options
+    )
+    data = {}
+    for key, value in params.items():
+        if isinstance(value, list):
+            data[f'{key}[]'] = value
+        elif value:
+            data[key] = value
+
+    response = await _http_client().post(
+        cloudinary.utils.cloudinary_api_url('upload', **options),
+        data=data,
+        files={'file': file},
+        headers={'User-Agent': cloudinary.get_user_agent(), **headers}
+    )
+    try:
+        result = response.json()
+    except ValueError:
+        raise cloudinary.exceptions.Error(
+            f"Error parsing server response ({response.status_code}) - {response.text}"
+        )
+    if 'error' in result:
+        raise cloudinary.exceptions.Error(result['error']['message'])
+    return result
+
+
+class LocalStubUploader:
+    """Stores uploads in a local directory, for tests and offline development.
+
+    Returns the same keys the views read from a Cloudinary upload result.
+    """
+
+    def __init__(self, location=None, base_url=None):
+        self.location = Path(location or os.path.join(tempfile.gettempdir(), 'checkmate-uploads'))
+        self.base_url = base_url
+
+    def upload(self, file, folder='', **options):
+        public_id = f'{folder}/{uuid.uuid4().hex}'.strip('/')
+        path = self.location / public_id
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        if isinstance(file, (str, os.PathLike)):
+            shutil.copyfile(file, path)
+        else:
+            with open(path, 'wb') as destination:
+                for chunk in file.chunks():
+                    destination.write(chunk)
+
+        if self.base_url:
+            secure_url = f'{self.base_url.rstrip("/")}/{public_id}'
+        else:
+            secure_url = path.as_uri()
+        return {'public_id': public_id, 'secure_url': secure_url}
+
+
+class SizeLimitUploadHandler(FileUploadHandler):
+    """Rejects a file as soon as it grows past its field's limit.
+
+    Must come first in FILE_UPLOAD_HANDLERS, the request is refused while
+    it is being parsed instead of after the whole body was read and spooled.
+    """
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.limit = upload_settings()['MAX_FILE_SIZES'].get(field_name)
+        self.received = 0
+        if self.limit is not None and self.content_length and self.content_length > self.limit:
+            self._reject()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.limit is not None and self.received > self.limit:
+            self._reject()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+    def _reject(self):
+        raise ValidationError({
+            self.field_name: f"File is larger than {filesizeformat(self.limit)}."
+        })
+
+
+def upload_settings():
+    return {**DEFAULTS, **getattr(settings, 'EMPLOYEE_UPLOADS', {})}
+
+
+@lru_cache(maxsize=None)
+def get_uploader():
+    config = upload_settings()
+    return import_string(config['BACKEND'])(**config['OPTIONS'])
+
+
+@lru_cache(maxsize=None)
+def _upload_executor():
+    return ThreadPoolExecutor(
+        max_workers=upload_settings()['MAX_WORKERS'],
+        thread_name_prefix='employee-upload'
+    )
+
+
+@lru_cache(maxsize=None)
+def _job_executor():
+    # Deferred jobs wait on uploads running in _upload_executor, so they
+    # get their own pool to never starve it
+    return ThreadPoolExecutor(
+        max_workers=upload_settings()['MAX_WORKERS'],
+        thread_name_prefix='employee-upload-job'
+    )
+
+
+def _reset_uploads(setting, **kwargs):
+    if setting == 'EMPLOYEE_UPLOADS':
+        get_uploader.cache_clear()
+
+
+setting_changed.connect(_reset_uploads)
+
+
+def upload_employee_files(photo, resume):
+    """Upload the photo and resume concurrently, return both upload results."""
+    uploader = get_uploader()
+    executor = _upload_executor()
+    with timing('upload'):
+        photo_future = executor.submit(uploader.upload, photo, **PHOTO_OPTIONS)
+        resume_future = executor.submit(uploader.upload, resume, **RESUME_OPTIONS)
+        return photo_future.result(), resume_future.result()
+
+
+async def aupload_employee_files(photo, resume):
+    """upload_employee_files for async views."""
+    uploader = get_uploader()
+    if hasattr(uploader, 'aupload'):
+        upload = uploader.aupload
+    else:
+        # Backends without an async client upload on the upload pool
+        def upload(file, **options):
+            return asyncio.wrap_future(_upload_executor().submit(uploader.upload, file, **options))
+    with timing('upload'):
+        return await asyncio.gather(upload(photo, **PHOTO_OPTIONS), upload(resume, **RESUME_OPTIONS))
+
+
+_pending_jobs = set()
+_pending_jobs_lock = threading.Lock()
+
+
+def schedule_employee_upload(employee_id, photo, resume):
+    """Upload the files in the background and fill in the employee's urls.
+
+    The files are copied to disk first since the request's uploaded files
+    are gone once the response is sent.
+    """
+    photo_path = spool_upload(photo)
+    resume_path = spool_upload(resume)
+    return run_in_background(_run_employee_upload, employee_id, photo_path, resume_path)
+
+
+def run_in_background(func, *args):
+    """Run an upload job on the background pool, see wait_for_pending_uploads."""
+    future = _job_executor().submit(func, *args)
+    with _pending_jobs_lock:
+        _pending_jobs.add(future)
+    future.add_done_callback(_forget_job)
+    return future
+
+
+def _forget_job(future):
+    with _pending_jobs_lock:
+        _pending_jobs.discard(future)
+
+
+def wait_for_pending_uploads(timeout=None):
+    """Block until the scheduled background uploads are done."""
+    with _pending_jobs_lock:
+        jobs = list(_pending_jobs)
+    wait(jobs, timeout=timeout)
+
+
+def spool_upload(file):
+    suffix = os.path.splitext(file.name or '')[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as spooled:
+        if hasattr(file, 'temporary_file_path'):
+            # Already on disk, the copy is done without reading it in
+            shutil.copyfile(file.temporary_file_path(), spooled.name)
+        else:
+            for chunk in file.chunks():
+                spooled.write(chunk)
+    return spooled.name
+
+
+def _run_employee_upload(employee_id, photo_path, resume_path):
+    from .models import Employee, EmployeeCounter, UploadState
+
+    def finish(**updates):
+        # modify returns the owners whose list versions the change bumps
+        employee = Employee.objects(id=employee_id).no_dereference().modify(
+            new=True, set__updated_at=timezone.now(), **updates
+        )
+        if employee is not None:
+            EmployeeCounter.touch(employee.uploaded_by_id, employee.checker_id)
+
+    try:
+        photo_result, resume_result = upload_employee_files(photo_path, resume_path)
+    except Exception:
+        logger.exception('Upload of files for employee %s failed', employee_id)
+        finish(set__upload_state=UploadState.FAILED)
+        return
+    finally:
+        for path in (photo_path, resume_path):
+            os.remove(path)
+
+    finish(
+        set__photo_url=photo_result['secure_url'],
+        set__photo_public_id=photo_result['public_id'],
+        set__resume_url=resume_result['secure_url'],
+        set__resume_public_id=resume_result['public_id'],
+        set__upload_state=UploadState.COMPLETE
+    )
@@ -1,14 +1,29 @@
+from django.conf import settings
 from django.urls import path
 from .views import *
 
+if settings.ASYNC_VIEWS:
+    from .async_views import (
+        AsyncLoginView as LoginView,
+        AsyncEmployeeListView as EmployeeListView,
+        AsyncEmployeeUploadView as EmployeeUploadView,
+        AsyncEmployeeStatusUpdateView as EmployeeStatusUpdateView,
+    )
+
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('register/maker/', MakerRegisterView.as_view(), name='register-maker'),
+    path('register/makers/', MakerBulkRegisterView.as_view(), name='register-makers'),
     path('fetch-makers/', GetCheckerMakers.as_view(), name='register-maker'),
     path('login/', LoginView.as_view(), name='login'),
     path('refresh-token/', RefreshTokenView.as_view(), name='token_refresh'),
     path('employees/upload/', EmployeeUploadView.as_view(), name='employee-upload'),
+    path('employees/import/', EmployeeImportView.as_view(), name='employee-import'),
+    path('employees/import/<str:job_id>/', EmployeeImportJobView.as_view(), name='employee-import-job'),
     path('employees/', EmployeeListView.as_view(), name='employee-list'),
+    path('employees/export/', EmployeeExportView.as_view(), name='employee-export'),
+    path('employees/counts/', EmployeeCountsView.as_view(), name='employee-counts'),
+    path('employees/status/', EmployeeBulkStatusUpdateView.as_view(), name='employee-bulk-status-update'),
     path('employees/<str:employee_id>/status/', EmployeeStatusUpdateView.as_view(), name='employee-status-update'),
     path('logout/', LogoutView.as_view())
 ]
\ No newline at end of file
@@ -1,23 +1,43 @@
 from django.shortcuts import render
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import RegisterSerializer, LoginSerializer, MakerRegisterSerializer, MakerSerializer, EmployeeSerializer, EmployeeUpdateSerializer, FetchEmployeeSerializer
+from .serializers import RegisterSerializer, LoginSerializer, MakerRegisterSerializer, MakerBulkRegisterSerializer, MakerListQuerySerializer, EmployeeSerializer, EmployeeUpdateSerializer, EmployeeListQuerySerializer, EmployeeExportQuerySerializer, EmployeeImportSerializer, ImportJobSerializer, EmployeeBulkStatusSerializer, build_employee_counts
 import logging
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.permissions import BasePermission
 from .jwt_middleware import JWTAuthentication
-from .models import Account, Employee, CustomerStatus
-from rest_framework.parsers import MultiPartParser, FormParser
+from .models import Account, Employee, EmployeeCounter, CustomerStatus, ImportJob
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
+from django.utils import timezone
+from django.conf import settings
+from .pagination import paginate_keyset
+from .mongo import ping_mongodb, pool_stats
+from .conditional import list_etag, etag_matches
+from .export import iter_employee_rows, ndjson_lines, csv_lines
+from .fast_serializers import JSONResponse, employee_row_mapper, maker_row_mapper, build_raw_account_email_map
+from .instrumentation import instrumentation_settings, metrics, timing
 
 # Create your views here.
 
 logger = logging.getLogger(__name__)
 
+EMPLOYEE_PAGE_SIZE = 50
+MAKER_PAGE_SIZE = 50
+# Rounds of guarded updates a bulk review makes before reporting conflicts
+BULK_REVIEW_ATTEMPTS = 3
+
+# Employee fields read to render a FetchEmployeeSerializer field, when they
+# are not just the field of the same name
+EMPLOYEE_FIELD_SOURCES = {
+    'uploaded_by': ('uploaded_by', 'uploaded_by_email'),
+    'checked_by': ('checked_by', 'checked_by_email'),
+}
+
 def get_tokens_for_user(user):
     refresh = RefreshToken.for_user(user)
 
@@ -29,7 +49,29 @@ def get_tokens_for_user(user):
     }
 
 
+def login_response(user):
+    """The response to a successful login, tokens in the body and as cookies."""
+    tokens = get_tokens_for_user(user)
+    user_data = {
+        "id": str(user.id),
+        "email": user.email,
+        "is_maker": user.is_maker,
+        "is_checker": user.is_checker,
+    }
+    response_data = {
+        "message": "Login successful",
+        "user": user_data,
+        "tokens": tokens
+    }
+    response = JsonResponse(response_data, status=status.HTTP_200_OK)
+    response.set_cookie('access_token', tokens['access'], httponly=True, secure=True, samesite='None')
+    response.set_cookie('refresh_token', tokens['refresh'], httponly=True, secure=True, samesite='None')
+    return response
+
+
 class RegisterView(APIView):
+    authentication_classes = []
+
     def post(self, request, *args, **kwargs):
         serializer = RegisterSerializer(data=request.data)
         if serializer.is_valid():
@@ -49,33 +91,21 @@ class RegisterView(APIView):
 
 
 class LoginView(APIView):
+    authentication_classes = []
+
     def post(self, request, *args, **kwargs):
         serializer = LoginSerializer(data=request.data)
         if serializer.is_valid():
             # Get the pre-authenticated user from serializer
             user = serializer.validated_data['user']
-            
-            tokens = get_tokens_for_user(user)
-            user_data = {
-                "id": str(user.id),
-                "email": user.email,
-                "is_maker": user.is_maker,
-                "is_checker": user.is_checker,
-            }
-            response_data = {
-                "message": "Login successful",
-                "user": user_data,
-                "tokens": tokens
-            }
-            response = JsonResponse(response_data, status=status.HTTP_200_OK)
-            response.set_cookie('access_token', tokens['access'], httponly=True, secure=True, samesite='None')
-            response.set_cookie('refresh_token', tokens['refresh'], httponly=True, secure=True, samesite='None')
-            return response
-            
+            return login_response(user)
+
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 class RefreshTokenView(APIView):
+    authentication_classes = []
+
     def post(self, request, *args, **kwargs):
         refresh_token = request.COOKIES.get('refresh_token')
         
@@ -119,7 +149,6 @@ class MakerRegisterView(APIView):
     permission_classes = [IsAuthenticated, IsChecker]
 
     def post(self, request, *args, **kwargs):
-        print('request.user', request.user)
         # Verify that the authenticated user is a checker
         if not request.user.is_checker:
             return Response(
@@ -151,14 +180,67 @@ class MakerRegisterView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
 
+class MakerBulkRegisterView(APIView):
+    permission_classes = [IsAuthenticated, IsChecker]
+    parser_classes = [JSONParser, MultiPartParser, FormParser]
+
+    def post(self, request):
+        """Create many makers at once, answer with a result per row."""
+        serializer = MakerBulkRegisterSerializer(data=request.data, context={'checker': request.user})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        results = serializer.save()
+        created = sum(1 for result in results if result['id'] is not None)
+        return Response({
+            'created': created,
+            'failed': len(results) - created,
+            'results': results,
+        })
+
+
 class GetCheckerMakers(APIView):
     def get(self, request):
-        """Get all makers created by the logged-in checker."""
+        """Get the makers created by the logged-in checker.
+
+        Paginated when limit or cursor is given, counts=true adds the number
+        of employees of each maker per status.
+        """
+        params = MakerListQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        options = params.validated_data
+
+        etag = list_etag(request.user.id)
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
         try:
             # Get makers where created_by matches the current user
-            makers = Account.objects(created_by=request.user.id, is_maker=True).all()
-            serializer = MakerSerializer(makers, many=True)
-            return Response(serializer.data)
+            makers = Account.objects(created_by=request.user.id, is_maker=True).only(
+                'id', 'email', 'is_active', 'date_joined'
+            ).as_pymongo()
+            paginate = 'limit' in options or 'cursor' in options
+            if paginate:
+                makers, next_cursor = paginate_keyset(
+                    makers,
+                    options.get('limit', MAKER_PAGE_SIZE),
+                    options.get('cursor'),
+                    field='date_joined'
+                )
+            else:
+                makers = list(makers.order_by('-date_joined', '-id'))
+
+            employee_counts = None
+            if options['counts']:
+                employee_counts = build_employee_counts(
+                    request.user.id, [maker['_id'] for maker in makers]
+                )
+            with timing('serialize'):
+                to_row = maker_row_mapper(employee_counts)
+                rows = [to_row(maker) for maker in makers]
+                if paginate:
+                    return JSONResponse({'results': rows, 'next_cursor': next_cursor}, headers={'ETag': etag})
+                return JSONResponse(rows, headers={'ETag': etag})
         except Exception as e:
             return Response({'error': str(e)}, status=400)
 
@@ -172,8 +254,6 @@ class EmployeeUploadView(APIView):
     parser_classes = [MultiPartParser, FormParser]
 
     def post(self, request):
-        print('request data', request.data)
-        print('request user', request.user.email)
         # Ensure only Makers can upload
         if not request.user.is_maker:
             return Response(
@@ -192,25 +272,141 @@ class EmployeeUploadView(APIView):
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class EmployeeImportView(APIView):
+    permission_classes = [IsAuthenticated, IsMaker]
+    parser_classes = [MultiPartParser, FormParser]
+
+    def post(self, request):
+        """Start a bulk import, poll EmployeeImportJobView for its results."""
+        serializer = EmployeeImportSerializer(
+            data=request.data,
+            context={'request': request}
+        )
+
+        if serializer.is_valid():
+            job = serializer.save()
+            return Response(ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class EmployeeImportJobView(APIView):
+    permission_classes = [IsAuthenticated, IsMaker]
+
+    def get(self, request, job_id):
+        job = ImportJob.objects(id=job_id, created_by=request.user).first()
+        if job is None:
+            return Response(
+                {"error": "Import job not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(ImportJobSerializer(job).data)
+
+
+def filter_employees(user, filters):
+    """The employees the user may see, narrowed by EmployeeListQuerySerializer's
+    filters and projected on its fields."""
+    if user.is_checker:
+        # Checkers see employees uploaded by their makers
+        employees = Employee.objects(checker_id=user.id)
+    elif user.is_maker:
+        # Makers see their own uploaded employees
+        employees = Employee.objects(uploaded_by=user)
+    else:
+        employees = Employee.objects.none()
+
+    if 'uploaded_by' in filters:
+        employees = employees.filter(uploaded_by=filters['uploaded_by'])
+    if 'status' in filters:
+        employees = employees.filter(status=CustomerStatus(filters['status']))
+    if 'created_after' in filters:
+        employees = employees.filter(created_at__gte=filters['created_after'])
+    if 'created_before' in filters:
+        employees = employees.filter(created_at__lt=filters['created_before'])
+
+    fields = filters.get('fields')
+    if fields:
+        # created_at and id are always needed to build the cursor
+        only = {'id', 'created_at'}
+        for name in fields:
+            only.update(EMPLOYEE_FIELD_SOURCES.get(name, (name,)))
+        employees = employees.only(*only)
+    return employees
+
+
 class EmployeeListView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        if request.user.is_checker:
-            # Checkers see employees uploaded by their makers
-            makers_under_checker = Account.objects(
-                created_by=request.user, 
-                is_maker=True
+        params = EmployeeListQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        filters = params.validated_data
+
+        # Polling clients that are up to date only cost the version lookup
+        etag = list_etag(request.user.id)
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        employees = filter_employees(request.user, filters)
+        fields = filters.get('fields')
+
+        # Raw documents, rendered by a row mapper rather than DRF fields.
+        # The emails of references that are not denormalised yet are
+        # resolved in a single accounts query instead of one per row
+        employees = employees.as_pymongo()
+        paginate = 'limit' in filters or 'cursor' in filters
+        if paginate:
+            employees, next_cursor = paginate_keyset(
+                employees,
+                filters.get('limit', EMPLOYEE_PAGE_SIZE),
+                filters.get('cursor')
             )
-            employees = Employee.objects(uploaded_by__in=makers_under_checker)
-        elif request.user.is_maker:
-            # Makers see their own uploaded employees
-            employees = Employee.objects(uploaded_by=request.user)
         else:
-            employees = Employee.objects.none()
+            employees = list(employees.order_by('-created_at', '-id'))
+
+        account_emails = build_raw_account_email_map(employees)
+        with timing('serialize'):
+            to_row = employee_row_mapper(fields, account_emails)
+            rows = [to_row(employee) for employee in employees]
+            if paginate:
+                return JSONResponse({'results': rows, 'next_cursor': next_cursor}, headers={'ETag': etag})
+            return JSONResponse(rows, headers={'ETag': etag})
+
+
+class EmployeeExportView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    CONTENT_TYPES = {
+        'ndjson': 'application/x-ndjson',
+        'csv': 'text/csv',
+    }
+
+    def get(self, request):
+        """Stream every employee of the list as NDJSON or CSV, newest first."""
+        params = EmployeeExportQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        filters = params.validated_data
+        output = filters['output']
+
+        employees = filter_employees(request.user, filters).order_by('-created_at', '-id')
+        rows = iter_employee_rows(employees, filters.get('fields'))
+        if output == 'csv':
+            lines = csv_lines(rows, filters.get('fields'))
+        else:
+            lines = ndjson_lines(rows)
+
+        response = StreamingHttpResponse(lines, content_type=self.CONTENT_TYPES[output])
+        response['Content-Disposition'] = f'attachment; filename="employees.{output}"'
+        return response
+
 
-        serializer = FetchEmployeeSerializer(employees, many=True)
-        return Response(serializer.data)
+class EmployeeCountsView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """Employees per status: a maker's own, or all of a checker's makers'."""
+        counter = EmployeeCounter.objects(id=request.user.id).first() or EmployeeCounter(id=request.user.id)
+        return Response(counter.as_dict())
 
 
 class EmployeeStatusUpdateView(APIView):
@@ -224,22 +420,16 @@ class EmployeeStatusUpdateView(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        try:
-            employee = Employee.objects.get(id=employee_id)
-        except Employee.DoesNotExist:
+        employee = Employee.objects(id=employee_id).first()
+        if employee is None:
             return Response(
-                {"error": "Employee not found"}, 
+                {"error": "Employee not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
-
-        # Ensure the Checker can only update employees under their Makers
-        makers_under_checker = Account.objects(
-            created_by=request.user, 
-            is_maker=True
-        )
-        if employee.uploaded_by not in makers_under_checker:
+        # The employee must belong to one of the checker's makers
+        if not employee.is_reviewable_by(request.user):
             return Response(
-                {"error": "You are not authorized to update this employee's status"}, 
+                {"error": "You are not authorized to update this employee's status"},
                 status=status.HTTP_403_FORBIDDEN
             )
 
@@ -251,12 +441,125 @@ class EmployeeStatusUpdateView(APIView):
         )
         
         if serializer.is_valid():
-            serializer.save()
+            employee = serializer.save()
             return Response(EmployeeSerializer(employee).data)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class EmployeeBulkStatusUpdateView(APIView):
+    permission_classes = [IsAuthenticated, IsChecker]
+
+    def patch(self, request):
+        """Set the status of many employees, answer with an outcome per id."""
+        serializer = EmployeeBulkStatusSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        ids = serializer.validated_data['ids']
+        status_enum = CustomerStatus(serializer.validated_data['status'])
+
+        # A checker may only review employees uploaded by their makers
+        authorized = Employee.reviewable_by(request.user)
+        authorized_ids = set()
+        changes = {request.user.id: {}}
+        remaining = ids
+        for _ in range(BULK_REVIEW_ATTEMPTS):
+            # Grouped by maker and current status, which is what the status
+            # counters need to move
+            groups = list(authorized(id__in=remaining).aggregate([{'$group': {
+                '_id': {'maker': '$uploaded_by', 'status': '$status'},
+                'ids': {'$push': '$_id'},
+            }}]))
+            remaining = []
+            for group in groups:
+                previous, group_ids = group['_id']['status'], group['ids']
+                authorized_ids.update(group_ids)
+                # Compare-and-set on the status the group was read with, like
+                # transition_status, so the counters move by what was updated
+                moved = authorized(id__in=group_ids, status=previous).update(
+                    set__status=status_enum,
+                    set__checker_id=request.user.id,
+                    set__checked_by=request.user,
+                    set__checked_by_email=request.user.email,
+                    set__updated_at=timezone.now()
+                )
+                if moved < len(group_ids):
+                    # Some were reviewed in between, read the group again
+                    remaining.extend(group_ids)
+                # Every updated employee changes its maker's list, moved or
+                # not the maker's version has to move
+                changes.setdefault(group['_id']['maker'], {})
+                if previous == status_enum.value or not moved:
+                    continue
+                for account_id in (group['_id']['maker'], request.user.id):
+                    deltas = changes.setdefault(account_id, {})
+                    deltas[previous] = deltas.get(previous, 0) - moved
+                    deltas[status_enum.value] = deltas.get(status_enum.value, 0) + moved
+            if not remaining:
+                break
+        if authorized_ids:
+            EmployeeCounter.apply(changes)
+        # Still racing with single reviews after every attempt
+        conflicted_ids = set(
+            authorized(id__in=remaining, status__ne=status_enum).scalar('id')
+        ) if remaining else set()
+
+        # Only tell missing and foreign employees apart when there are any
+        rejected_ids = [employee_id for employee_id in ids if employee_id not in authorized_ids]
+        existing_ids = set(Employee.objects(id__in=rejected_ids).scalar('id')) if rejected_ids else set()
+
+        results = []
+        for employee_id in ids:
+            if employee_id in conflicted_ids:
+                outcome = 'conflict'
+            elif employee_id in authorized_ids:
+                outcome = 'updated'
+            elif employee_id in existing_ids:
+                outcome = 'forbidden'
+            else:
+                outcome = 'not_found'
+            results.append({'id': employee_id, 'outcome': outcome})
+
+        return Response({
+            'status': status_enum.value,
+            'updated': len(authorized_ids - conflicted_ids),
+            'results': results,
+        })
+
+class ReadinessView(APIView):
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request):
+        """Ready when MongoDB answers, with the connection pool counters."""
+        try:
+            ping_mongodb(settings.MONGODB['READY_TIMEOUT'])
+        except Exception as e:
+            return Response({
+                'status': 'unavailable',
+                'error': str(e) or e.__class__.__name__,
+                'pools': pool_stats.stats(),
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({'status': 'ready', 'pools': pool_stats.stats()})
+
+
+class MetricsView(APIView):
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request):
+        """TimingMiddleware's histograms in the Prometheus text format.
+
+        Each worker process keeps its own, scrape them per process.
+        """
+        if not instrumentation_settings()['ENABLED']:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 class LogoutView(APIView):
+    authentication_classes = []
+
     def post(self, request):
         response = Response({"message": "Logged out successfully"}, status=status.HTTP_200_OK)
         